@@ -0,0 +1,251 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+__all__ = [
+    'DEFAULT_SIZES',
+    'generate_dataset',
+]
+
+DEFAULT_SIZES = {
+    'departments': 20,
+    'equipment_classes': 60,
+    'entities': 2000,
+    'phases_per_route': 3,
+    'operations_per_route': 10,
+    'alternate_routes': 0.1,
+    'batches': 20000,
+    'tasks': 10000,
+    'orders': 50,
+    'spec_depth': 5,
+}
+
+# окончания обозначений операций, по которым работают правила исключения
+_OPERATION_SUFFIXES = ('', '', '', '', '', '', 'н', 'с', 'Ц', 'МН')
+
+_IA_TIMEZONE = timezone(timedelta(hours=3))
+
+
+def _departments(count):
+    return [{
+        'id': i,
+        'identity': f'{i:05d}',
+        'name': f'{i:02d}-{i % 7}',
+    } for i in range(1, count + 1)]
+
+
+def _equipment_classes(count):
+    return [{
+        'id': i,
+        'identity': f'WC{i:04d}',
+        'name': 'Контроль' if i % 10 == 0 else
+                'Ручные операции' if i % 10 == 5 else f'Станок {i}',
+        'department_id': None,
+    } for i in range(1, count + 1)]
+
+
+def _equipment(equipment_classes, departments, rnd):
+    return [{
+        'id': i,
+        'identity': f'EQ{i:05d}',
+        'name': f'Оборудование {i}',
+        'equipment_class_id': equipment_class['id'],
+        'department_id': rnd.choice(departments)['id'],
+    } for i, equipment_class in enumerate(
+        equipment_classes * 2, start=1
+    )]
+
+
+def _routes(entities, sizes, departments, equipment_classes, rnd):
+    routes, phases, operations = [], [], []
+    for entity in entities:
+        route_count = 2 if rnd.random() < sizes['alternate_routes'] else 1
+        for alternate in range(route_count):
+            route_id = len(routes) + 1
+            routes.append({
+                'id': route_id,
+                'identity': f"{entity['identity']}_TP{alternate + 1}",
+                'entity_id': entity['id'],
+                'alternate': bool(alternate),
+            })
+            department = rnd.choice(departments)
+            route_phases = []
+            for phase in range(sizes['phases_per_route']):
+                phase_id = len(phases) + 1
+                identity = f"{department['identity']}{route_id:06d}{phase:02d}"
+                if rnd.random() < 0.2:
+                    identity += f'-{phase}'
+                phases.append({
+                    'id': phase_id,
+                    'identity': identity,
+                    'entity_route_id': route_id,
+                })
+                route_phases.append(phase_id)
+            for number in range(sizes['operations_per_route']):
+                operation_id = len(operations) + 1
+                prod_time = rnd.randint(60, 7200)
+                operations.append({
+                    'id': operation_id,
+                    'identity': f'OP{operation_id:07d}'
+                                f'{rnd.choice(_OPERATION_SUFFIXES)}',
+                    'name': f'Операция {number + 1}',
+                    'nop': f'{route_id:06d}_{(number + 1) * 5:03d}' +
+                           ('_1' if rnd.random() < 0.05 else ''),
+                    'entity_route_id': route_id,
+                    'entity_route_phase_id': route_phases[
+                        number * len(route_phases) //
+                        sizes['operations_per_route']
+                    ] if rnd.random() > 0.01 else None,
+                    'department_id': rnd.choice(departments)['id'],
+                    'equipment_class_id':
+                        rnd.choice(equipment_classes)['id'],
+                    'prod_time': prod_time,
+                    'setup_time': rnd.choice((0, 0, 0, prod_time // 4)),
+                    'prep_time': rnd.choice((0, 0, 0, prod_time // 8)),
+                })
+    return routes, phases, operations
+
+
+def _specification(entities, depth, rnd):
+    # дерево сборок заданной глубины: ДСЕ разбиты на уровни, каждая
+    # ДСЕ нижнего уровня входит в одну-две сборки уровня выше, так
+    # что часть подсборок общая для нескольких изделий
+    levels = [entities[level::depth] for level in range(depth)]
+    rows = []
+    for parents, children in zip(levels, levels[1:]):
+        for child in children:
+            for parent in rnd.sample(parents, min(len(parents), 2)):
+                rows.append({
+                    'parent_id': parent['id'],
+                    'child_id': child['id'],
+                    'amount': rnd.randint(1, 4),
+                })
+    # IA отдает спецификацию упорядоченной по родителю и ребенку
+    rows.sort(key=lambda row: (row['parent_id'], row['child_id']))
+    return rows
+
+
+def _batches(count, entities, operations, rnd):
+    return [{
+        'id': i,
+        'identity': f'П{i:07d}_{rnd.randint(1, 9999):04d}',
+        'entity_id': rnd.choice(entities)['id'],
+        'operation_id': None if rnd.random() < 0.2 else
+                        rnd.choice(operations)['id'],
+        'operation_progress': rnd.choice((0, 0.5, 1)),
+        'amount': rnd.randint(1, 50),
+        'entity_batch_snapshot_id': None if rnd.random() < 0.9 else i,
+    } for i in range(1, count + 1)]
+
+
+def _simulation_tasks(sizes, tables, rnd):
+    # ответ rest/collection/simulation_equipment со всеми вложенными
+    # таблицами, которые запрашивает сменное задание
+    operations = tables['operation']
+    simulation_equipment = [{
+        'id': equipment['id'],
+        'equipment_id': equipment['id'] if equipment['id'] % 4 else None,
+        'equipment_class_id': equipment['equipment_class_id'],
+        'department_id': equipment['department_id'],
+    } for equipment in tables['equipment']]
+    orders = [{
+        'id': i,
+        'name': f'З{i:06d}/{rnd.randint(10, 99)}',
+    } for i in range(1, sizes['orders'] + 1)]
+
+    batch_count = max(1, sizes['tasks'] // 5)
+    simulation_batches = [{
+        'id': i,
+        'entity_id': rnd.choice(tables['entity'])['id'],
+    } for i in range(1, batch_count + 1)]
+    order_batches = [{
+        'id': i,
+        'simulation_entity_batch_id': i,
+        'order_id': rnd.choice(orders)['id'],
+    } for i in range(1, batch_count + 1)]
+
+    now = datetime.now(_IA_TIMEZONE).replace(microsecond=0)
+    tasks, task_equipment = [], []
+    for i in range(1, sizes['tasks'] + 1):
+        start = now + timedelta(
+            hours=rnd.randint(-12, 72), minutes=rnd.randint(0, 59)
+        )
+        stop = start + timedelta(minutes=rnd.randint(5, 240))
+        tasks.append({
+            'id': i,
+            'operation_id': rnd.choice(operations)['id'],
+            'simulation_entity_batch_id':
+                rnd.choice(simulation_batches)['id'],
+            'start_date': start.isoformat(),
+            'stop_date': stop.isoformat(),
+            'start_time': rnd.randint(0, 72 * 3600),
+            'entity_amount': rnd.randint(1, 20),
+            'start_labor': rnd.choice((None, 0, 0.5)),
+            'stop_labor': rnd.choice((None, 1, 0.5)),
+            'type': rnd.choice((0, 0, 0, 1)),
+        })
+        task_equipment.append({
+            'id': i,
+            'simulation_operation_task_id': i,
+            'simulation_equipment_id':
+                rnd.choice(simulation_equipment)['id'],
+        })
+
+    return {
+        'simulation_equipment': simulation_equipment,
+        'simulation_operation_task_equipment': task_equipment,
+        'simulation_operation_task': tasks,
+        'simulation_entity_batch': simulation_batches,
+        'simulation_order_entity_batch': order_batches,
+        'order': orders,
+        'operation': operations,
+        'entity_route': tables['entity_route'],
+        'entity': tables['entity'],
+        'equipment': tables['equipment'],
+        'equipment_class': tables['equipment_class'],
+        'department': tables['department'],
+    }
+
+
+def generate_dataset(seed=0, **sizes):
+    # таблицы IA (имя -> строки) и вложенный ответ сменного задания
+    # в ключе simulation_equipment; одинаковые seed и размеры дают
+    # одинаковые данные, кроме дат заданий, отсчитываемых от текущего
+    # времени
+    unknown = set(sizes) - DEFAULT_SIZES.keys()
+    if unknown:
+        raise ValueError(
+            f'Неизвестные размеры набора данных: {", ".join(sorted(unknown))}'
+        )
+    sizes = {**DEFAULT_SIZES, **sizes}
+    rnd = random.Random(seed)
+
+    tables = {
+        'department': _departments(sizes['departments']),
+        'entity': [{
+            'id': i,
+            'identity': f'ДСЕ{i:07d}',
+            'name': f'Деталь {i}',
+        } for i in range(1, sizes['entities'] + 1)],
+    }
+    tables['equipment_class'] = _equipment_classes(
+        sizes['equipment_classes']
+    )
+    tables['equipment'] = _equipment(
+        tables['equipment_class'], tables['department'], rnd
+    )
+    (
+        tables['entity_route'],
+        tables['entity_route_phase'],
+        tables['operation'],
+    ) = _routes(
+        tables['entity'], sizes, tables['department'],
+        tables['equipment_class'], rnd
+    )
+    tables['specification_item'] = _specification(
+        tables['entity'], max(1, sizes['spec_depth']), rnd
+    )
+    tables['entity_batch'] = _batches(
+        sizes['batches'], tables['entity'], tables['operation'], rnd
+    )
+    tables['simulation_equipment'] = _simulation_tasks(sizes, tables, rnd)
+    return tables
@@ -0,0 +1,206 @@
+import json
+import re
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlparse
+
+from benchmark.dataset import generate_dataset
+
+__all__ = [
+    'FakeIAServer',
+]
+
+_COLLECTION_PATH = re.compile(r'/rest/collection/(\w+)$')
+_ID_GT_FILTER = re.compile(r'\bid gt (\d+)')
+_TASK_TYPE_FILTER = re.compile(
+    r'simulation_operation_task\.type in (\[[^\]]*\])'
+)
+
+_SESSION_COOKIE = 'benchmark-session'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload, status=200, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        ia = self.server.ia
+        ia.count('requests')
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        ia.wait()
+        if urlparse(self.path).path.endswith('/action/login'):
+            ia.count('login')
+            return self._send(
+                {'data': True},
+                headers={'Set-Cookie': f'session={_SESSION_COOKIE}; Path=/'}
+            )
+        self._send({}, status=404)
+
+    def do_GET(self):
+        ia = self.server.ia
+        ia.count('requests')
+        ia.wait()
+        url = urlparse(self.path)
+        if url.path.endswith('/action/primary_simulation_session'):
+            return self._send({'data': 1})
+        match = _COLLECTION_PATH.search(url.path)
+        if match is None:
+            return self._send({}, status=404)
+        self._send(ia.collection(match.group(1), parse_qs(url.query)))
+
+
+def _filter_task_types(payload, task_types):
+    # задания нужных типов, их связи с оборудованием и оборудование,
+    # на котором осталось хотя бы одно задание
+    task_types = {str(task_type) for task_type in task_types}
+    tasks = [
+        task for task in payload['simulation_operation_task']
+        if str(task['type']) in task_types
+    ]
+    task_ids = {task['id'] for task in tasks}
+    links = [
+        link for link in payload['simulation_operation_task_equipment']
+        if link['simulation_operation_task_id'] in task_ids
+    ]
+    equipment_ids = {link['simulation_equipment_id'] for link in links}
+    return {
+        **payload,
+        'simulation_equipment': [
+            row for row in payload['simulation_equipment']
+            if row['id'] in equipment_ids
+        ],
+        'simulation_operation_task_equipment': links,
+        'simulation_operation_task': tasks,
+    }
+
+
+class FakeIAServer(object):
+    # Локальная замена IA для замеров: action/login,
+    # action/primary_simulation_session и rest/collection/<таблица>
+    # с постраничной выдачей start/stop. Из фильтров учитываются только
+    # "id gt" и тип заданий "simulation_operation_task.type in [...]"
+    # в сменном задании; остальные условия (окна start_time, сессия,
+    # даты изменения) игнорируются, поэтому окна и синхронизация по
+    # дате получают больше строк, чем вернул бы IA. Задержка latency
+    # (в секундах) добавляется к каждому ответу.
+
+    def __init__(self, dataset, latency=0.0, host='127.0.0.1', port=0):
+        self.dataset = dataset
+        self.latency = latency
+        self.stats = {'requests': 0, 'login': 0}
+        self._stats_lock = Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.ia = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, table, query):
+        query_filter = ' '.join(query.get('filter', []))
+        if table == 'simulation_equipment':
+            payload = self.dataset['simulation_equipment']
+            type_filter = _TASK_TYPE_FILTER.search(query_filter)
+            if type_filter:
+                payload = _filter_task_types(
+                    payload, json.loads(type_filter.group(1))
+                )
+            main_rows = payload['simulation_equipment']
+        else:
+            payload = {}
+            main_rows = self.dataset.get(table, [])
+
+        id_filter = _ID_GT_FILTER.search(query_filter)
+        if id_filter:
+            last_id = int(id_filter.group(1))
+            main_rows = [row for row in main_rows if row['id'] > last_id]
+
+        start = int(query.get('start', [0])[0])
+        stop = int(query.get('stop', [len(main_rows)])[0])
+        return {
+            **payload,
+            'meta': {'count': len(main_rows)},
+            table: main_rows[start:stop],
+        }
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def fake_ia():
+    parser = ArgumentParser(
+        description='Локальный сервер IA с синтетическими данными'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='задержка каждого ответа, секунды')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--entities', type=int)
+    parser.add_argument('--batches', type=int)
+    parser.add_argument('--tasks', type=int)
+    parser.add_argument('--orders', type=int)
+    args = parser.parse_args()
+
+    sizes = {
+        name: getattr(args, name)
+        for name in ('entities', 'batches', 'tasks', 'orders')
+        if getattr(args, name) is not None
+    }
+    server = FakeIAServer(
+        generate_dataset(args.seed, **sizes),
+        args.latency,
+        args.host,
+        args.port,
+    )
+    print(f'IA: {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    fake_ia()
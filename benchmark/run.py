@@ -0,0 +1,218 @@
+import json
+import os
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from importlib import import_module
+from multiprocessing import Process, Queue
+from tempfile import TemporaryDirectory
+
+import urllib3
+
+from benchmark.dataset import DEFAULT_SIZES, generate_dataset
+from benchmark.fake_ia import FakeIAServer
+
+__all__ = [
+    'run_benchmark',
+]
+
+VARIANTS = {
+    'orders': 'logic.iaimportexport_with_orders',
+    'base': 'logic.iaimportexport',
+}
+
+DEFAULT_EXPORTS = (
+    'export_entities',
+    'export_ca_spec',
+    'export_ca_bom',
+    'export_ca_routes',
+    'export_ca_phases',
+    'export_ca_operations',
+    'export_ca_wip',
+    'export_ca_zapasy',
+    'export_pg_wip',
+    'export_ca_daily_tasks',
+)
+
+# настройки IA, при которых выгрузки работают на синтетических данных
+_IA_CONFIG = {
+    'login': 'benchmark',
+    'password': 'benchmark',
+    'phase_name_length': 7,
+    'short_phase_name_length': 4,
+    'daily_task_period': 72,
+    'skip_dept': None,
+    'only_dept': None,
+}
+
+
+def _serve(seed, sizes, latency, urls):
+    server = FakeIAServer(generate_dataset(seed, **sizes), latency)
+    urls.put(server.url)
+    server.serve_forever()
+
+
+def _measure(ia_class, config, method, trace_memory):
+    # Каждая выгрузка выполняется в новом сеансе IA, чтобы в замер
+    # входили загрузка таблиц и построение справочников. Файлы сеанса
+    # (хранилище сменных заданий и т.п.) пишутся во временную папку.
+    # Выгрузки из export_dependencies выполняются до начала замера,
+    # после чего загруженные ими таблицы сбрасываются, и замеряемая
+    # выгрузка загружает их заново, как и выгрузки без зависимостей.
+    cwd = os.getcwd()
+    peak = None
+    with TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            with ia_class.from_config(config) as ia:
+                dependencies = ia.export_dependencies.get(method, ())
+                for dependency in dependencies:
+                    for _ in ia.iter_export(dependency):
+                        pass
+                if dependencies:
+                    _drop_loaded_tables(ia)
+                if trace_memory:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                records = sum(1 for _ in ia.iter_export(method))
+                elapsed = time.perf_counter() - started
+                if trace_memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            os.chdir(cwd)
+    return records, elapsed, peak
+
+
+def _drop_loaded_tables(ia):
+    # Результаты зависимостей (например, заказы маршрутов для фаз)
+    # остаются, а таблицы, справочники и собранные из сменного задания
+    # заказы загружаются замеряемой выгрузкой заново.
+    ia.cache.clear()
+    ia.cache_fields.clear()
+    if hasattr(ia, '_entity_orders'):
+        ia._entity_orders = None
+        ia._order_expansion = None
+
+
+def run_benchmark(variant='orders', exports=DEFAULT_EXPORTS, seed=0,
+                  sizes=None, latency=0.0, repeat=1, trace_memory=True,
+                  ia_options=None):
+    # Данные генерируются и отдаются отдельным процессом, поэтому
+    # сервер не влияет ни на время, ни на пиковую память выгрузок.
+    # FakeIAServer учитывает не все фильтры IA (см. его описание),
+    # поэтому количество записей сравнимо только между прогонами
+    # на нем же, но не с выгрузками из настоящего IA.
+    ia_class = import_module(VARIANTS[variant]).IAImportExport
+    urls = Queue()
+    server = Process(
+        target=_serve,
+        args=(seed, sizes or {}, latency, urls),
+        daemon=True
+    )
+    server.start()
+    try:
+        config = {**_IA_CONFIG, **(ia_options or {}), 'url': urls.get()}
+        results = []
+        for method in exports:
+            # время -- лучшее из repeat прогонов без tracemalloc, который
+            # сам замедляет выполнение; пик памяти -- отдельным прогоном
+            timings = []
+            for _ in range(max(1, repeat)):
+                records, elapsed, _ = _measure(
+                    ia_class, config, method, False
+                )
+                timings.append(elapsed)
+            peak = trace_memory and _measure(
+                ia_class, config, method, True
+            )[2] or None
+            results.append({
+                'export': method,
+                'records': records,
+                'seconds': min(timings),
+                'peak_mb': peak and peak / 1024 / 1024,
+            })
+        return results
+    finally:
+        server.terminate()
+        server.join()
+
+
+def _option(value):
+    key, _, raw = value.partition('=')
+    try:
+        return key, json.loads(raw)
+    except ValueError:
+        return key, raw
+
+
+def benchmark():
+    parser = ArgumentParser(
+        description='Замер времени и пиковой памяти выгрузок IA '
+                    'на синтетических данных'
+    )
+    parser.add_argument('-v', '--variant', choices=VARIANTS,
+                        default='orders')
+    parser.add_argument('-e', '--export', action='append', dest='exports',
+                        help='метод выгрузки, по умолчанию все основные')
+    parser.add_argument('-n', '--repeat', type=int, default=1)
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='задержка каждого ответа IA, секунды')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', default=False)
+    parser.add_argument('-o', '--option', action='append', type=_option,
+                        default=[],
+                        help='настройка IA в виде ключ=значение (JSON)')
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    for name, value in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}",
+                            type=type(value), dest=name)
+
+    args = parser.parse_args()
+
+    sizes = {
+        name: getattr(args, name)
+        for name in DEFAULT_SIZES
+        if getattr(args, name) is not None
+    }
+    try:
+        import_module(VARIANTS[args.variant])
+    except ImportError as error:
+        parser.error(f'вариант {args.variant} недоступен: {error}')
+
+    results = run_benchmark(
+        args.variant,
+        args.exports or DEFAULT_EXPORTS,
+        args.seed,
+        sizes,
+        args.latency,
+        args.repeat,
+        not args.no_memory,
+        dict(args.option),
+    )
+    # итоги выводятся в конце, после сообщений самих выгрузок
+    print('{:<28}{:>10}{:>12}{:>12}'.format(
+        'Выгрузка', 'Записей', 'Время, с', 'Пик, МБ'
+    ))
+    for result in results:
+        print('{:<28}{:>10}{:>12.2f}{:>12}'.format(
+            result['export'],
+            result['records'],
+            result['seconds'],
+            '-' if result['peak_mb'] is None else
+            f"{result['peak_mb']:.1f}",
+        ))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({
+                'variant': args.variant,
+                'sizes': {**DEFAULT_SIZES, **sizes},
+                'latency': args.latency,
+                'results': results,
+            }, output_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    urllib3.disable_warnings()
+    benchmark()
@@ -0,0 +1,197 @@
+from collections import OrderedDict
+
+__all__ = [
+    'BomCycleError',
+    'BomIndex',
+]
+
+# Сколько строк составов (id ДСЕ -> количество) BomIndex хранит в кэше
+# разузлованных сборок.
+DEFAULT_CACHE_SIZE = 1000000
+
+
+class BomCycleError(ValueError):
+
+    def __init__(self, cycle):
+        self.cycle = cycle
+        super().__init__(
+            'Цикл в спецификации: {}'.format(' -> '.join(map(str, cycle)))
+        )
+
+
+class BomIndex(object):
+    # Многоуровневое разузлование по строкам specification_item.
+    # Циклы ищутся одним обходом всей спецификации. Состав сборки
+    # считается сверху вниз: множители ДСЕ накапливаются в одном словаре
+    # в топологическом порядке ее поддерева. Составы общих сборок (с
+    # несколькими родителями) и запрошенных сборок запоминаются, поэтому
+    # общая сборка разузловывается один раз для всех сборок, в которые
+    # она входит. Кэш ограничен cache_size строками составов и вытесняет
+    # давно не использованные составы; вытесненная сборка при следующем
+    # обращении просто разузловывается заново. Обходы итеративные, без
+    # рекурсии, поэтому глубина не ограничена стеком интерпретатора.
+
+    def __init__(self, specification, cache_size=DEFAULT_CACHE_SIZE):
+        # родитель -> [(ребенок, количество)], повторяющиеся строки
+        # одной пары складываются
+        children = {}
+        parents = {}
+        for row in specification:
+            items = children.setdefault(row['parent_id'], {})
+            items[row['child_id']] = items.get(row['child_id'], 0) + \
+                row['amount']
+            parents.setdefault(row['child_id'], set()).add(row['parent_id'])
+        self._children = {
+            parent_id: tuple(items.items())
+            for parent_id, items in children.items()
+        }
+        self.roots = [
+            parent_id for parent_id in self._children
+            if parent_id not in parents
+        ]
+        self._shared = {
+            entity_id for entity_id, entity_parents in parents.items()
+            if len(entity_parents) > 1 and entity_id in self._children
+        }
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cached_items = 0
+        self._cycles = None
+        self._found_cycles = None
+
+    @property
+    def assemblies(self):
+        return self._children.keys()
+
+    def children(self, entity_id):
+        return self._children.get(entity_id, ())
+
+    def totals(self, entity_id):
+        # id ДСЕ всех уровней -> количество на одну сборку entity_id;
+        # результат может быть общим с кэшем, его нельзя изменять
+        cycles = self._find_cycles()
+        if entity_id in cycles:
+            raise BomCycleError(cycles[entity_id])
+        cached = self._cache_get(entity_id)
+        if cached is not None:
+            return cached
+        # общие сборки поддерева разузловываются раньше содержащих их,
+        # поэтому каждая из них раскрывается один раз
+        for node in reversed(self._topological_order(entity_id, self._cache)):
+            if node in self._shared and node not in self._cache:
+                self._cache_put(node, self._explode(node))
+        totals = self._cache_get(entity_id)
+        if totals is None:
+            totals = self._explode(entity_id)
+            self._cache_put(entity_id, totals)
+        return totals
+
+    def _explode(self, entity_id):
+        # Поддерево обходится до запомненных сборок, их составы
+        # добавляются целиком с множителем сборки. Множители переходят
+        # только по незапомненным сборкам, поэтому каждый путь от
+        # entity_id учитывается один раз.
+        multipliers = {entity_id: 1}
+        totals = {}
+        for node in self._topological_order(entity_id, self._cache):
+            quantity = multipliers[node]
+            if node == entity_id:
+                pass
+            elif node in self._cache:
+                totals[node] = totals.get(node, 0) + quantity
+                for item_id, amount in self._cache[node].items():
+                    totals[item_id] = totals.get(item_id, 0) + \
+                        quantity * amount
+                continue
+            else:
+                totals[node] = totals.get(node, 0) + quantity
+            for child_id, amount in self.children(node):
+                multipliers[child_id] = multipliers.get(child_id, 0) + \
+                    quantity * amount
+        return totals
+
+    def _cache_get(self, entity_id):
+        totals = self._cache.get(entity_id)
+        if totals is not None:
+            self._cache.move_to_end(entity_id)
+        return totals
+
+    def _cache_put(self, entity_id, totals):
+        if len(totals) > self._cache_size:
+            return
+        self._cache[entity_id] = totals
+        self._cached_items += len(totals)
+        while self._cached_items > self._cache_size:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_items -= len(evicted)
+
+    def _topological_order(self, entity_id, stop=()):
+        # ДСЕ поддерева entity_id так, что сборка идет раньше всех своих
+        # составных частей; поддерево уже проверено на циклы. Составные
+        # части сборок из stop не обходятся.
+        order = []
+        visited = {entity_id}
+        stack = [(entity_id, iter(self.children(entity_id)))]
+        while stack:
+            node, children = stack[-1]
+            for child_id, _ in children:
+                if child_id not in visited:
+                    visited.add(child_id)
+                    stack.append((
+                        child_id,
+                        iter(() if child_id in stop
+                             else self.children(child_id))
+                    ))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        order.reverse()
+        return order
+
+    def _find_cycles(self):
+        # ДСЕ, из которых достижим цикл -> один из таких циклов
+        if self._cycles is not None:
+            return self._cycles
+        cycles = {}
+        found = []
+        finished = set()
+        for entity_id in self._children:
+            if entity_id in finished:
+                continue
+            path = [entity_id]
+            on_path = {entity_id}
+            stack = [(entity_id, iter(self.children(entity_id)))]
+            while stack:
+                node, children = stack[-1]
+                for child_id, _ in children:
+                    if child_id in on_path:
+                        cycle = path[path.index(child_id):] + [child_id]
+                        found.append(cycle)
+                        cycles.setdefault(node, cycle)
+                    elif child_id in finished:
+                        if child_id in cycles:
+                            cycles.setdefault(node, cycles[child_id])
+                    else:
+                        path.append(child_id)
+                        on_path.add(child_id)
+                        stack.append(
+                            (child_id, iter(self.children(child_id)))
+                        )
+                        break
+                else:
+                    stack.pop()
+                    path.pop()
+                    on_path.discard(node)
+                    finished.add(node)
+                    # сборки, из которых достижим цикл, тоже не считаются
+                    if stack and node in cycles:
+                        cycles.setdefault(stack[-1][0], cycles[node])
+        self._cycles = cycles
+        self._found_cycles = found
+        return cycles
+
+    def cycles(self):
+        # все циклы спецификации, включая недостижимые из корневых сборок
+        self._find_cycles()
+        return list(self._found_cycles)
@@ -1,8 +1,6 @@
 import csv
 from collections import defaultdict
 
-from utils.list_to_dict import list_to_dict
-
 
 def get_erp_fact_from_csv(csv_file, ia):
     with open(csv_file, 'r') as input_file:
@@ -10,9 +8,7 @@ def get_erp_fact_from_csv(csv_file, ia):
 
     ia._perform_login()
 
-    entity_routes_dict = list_to_dict(
-        ia._get_from_rest_collection('entity_route')
-    )
+    entity_routes_dict = ia.reference.entity_routes
     operations = sorted(
         ia._get_from_rest_collection('operation'),
         key=lambda k: (k['entity_route_id'], k['nop'])
@@ -0,0 +1,97 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from utils.collection_payload import project_rows
+
+__all__ = [
+    'AsyncCollectionFetcher',
+]
+
+
+class AsyncCollectionFetcher(object):
+    # Загружает таблицы IA и все их страницы одновременно в одном цикле
+    # событий. Одновременно выполняется не больше concurrency запросов.
+    # Запросы выполняются синхронным клиентом IAImportExport в отдельных
+    # потоках, поэтому сессия, авторизация, повторы и кэш остаются
+    # общими. Отдельная асинхронная HTTP-библиотека не требуется.
+
+    def __init__(self, ia, concurrency):
+        self._ia = ia
+        self._concurrency = concurrency
+        self._loop = None
+        self._requests = None
+        self._pbar = None
+
+    async def get_page(self, table, start, step, query):
+        # страницы строит и запрашивает _get_rest_collection_page, общий
+        # с обычной загрузкой. Во время prefetch пул fetch_workers
+        # не используется: все страницы идут через пул _requests.
+        page = await self._loop.run_in_executor(
+            self._requests, self._ia._get_rest_collection_page,
+            table, start, step, query
+        )
+        self._pbar.update(len(page.get(table, ())))
+        return page
+
+    async def fetch_collection(self, table, query_filter=None, fields=None):
+        step = self._ia.page_size
+        query = self._ia._get_rest_collection_query(
+            table, query_filter, fields
+        )
+        first_page = await self.get_page(table, 0, step, query)
+        if table not in first_page:
+            return []
+        count = first_page['meta']['count']
+        self._pbar.total += count
+        self._pbar.refresh()
+        pages = await asyncio.gather(*(
+            self.get_page(table, start, step, query)
+            for start in range(step, count, step)
+        ))
+        rows = project_rows(first_page[table], fields)
+        for page in pages:
+            rows += project_rows(page.get(table, []), fields)
+        return rows
+
+    def fetch(self, table, query_filter=None, fields=None):
+        # Вызывается из потока таблицы вместо постраничной загрузки
+        # IAImportExport._fetch_rest_collection.
+        return asyncio.run_coroutine_threadsafe(
+            self.fetch_collection(table, query_filter, fields),
+            self._loop
+        ).result()
+
+    async def get_collection(self, table, tables_executor):
+        # Кэш в памяти и на диске, синхронизация и сохранение остаются
+        # за IAImportExport._get_from_rest_collection, который выполняется
+        # в отдельном потоке и загружает страницы через fetch.
+        return await self._loop.run_in_executor(
+            tables_executor, self._ia._get_from_rest_collection, table
+        )
+
+    async def _prefetch(self, tables):
+        self._loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(
+                max_workers=self._concurrency,
+                thread_name_prefix='ia-request'
+        ) as self._requests, ThreadPoolExecutor(
+            max_workers=len(tables),
+            thread_name_prefix='ia-table'
+        ) as tables_executor:
+            await asyncio.gather(*(
+                self.get_collection(table, tables_executor)
+                for table in tables
+            ))
+
+    def prefetch(self, tables):
+        if not tables:
+            return
+        self._pbar = tqdm(desc='Загрузка таблиц IA', total=0)
+        self._ia._collection_fetcher = self
+        try:
+            asyncio.run(self._prefetch(tables))
+        finally:
+            self._ia._collection_fetcher = None
+            self._pbar.close()
@@ -2,17 +2,37 @@ import csv
 import json
 import time
 from collections import defaultdict
-from datetime import datetime, date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
 from functools import partialmethod
 from json import JSONDecodeError
 from math import floor
+from threading import Lock
 from urllib.parse import urljoin
 
 from requests import Session
 from tqdm import tqdm
 
+from utils.collection_cache import CollectionCache, SYNC_OVERLAP, \
+    merge_by_id, fields_cover, merge_fields
+from utils.columnar_table import ColumnarTable, DEFAULT_PROJECTIONS
+from utils.collection_payload import merge_collection_payload, \
+    collection_payload_to_lists, project_rows
+from utils.json_stream import JSONCollectionStream
+from utils.request_policy import connection_pool_size, \
+    mount_retry_adapter, request_timeout, \
+    RequestStats
+from utils.task_clock import TaskClock
+from utils.task_store import TaskStore
 from utils.list_to_dict import list_to_dict, list_to_defdict
 from .base import Base
+from .bom import BomCycleError
+from .ia_async import AsyncCollectionFetcher
+from .order_expansion import OrderExpansion
+from .operation_rules import DEFAULT_EXCLUSION_RULES, OperationFlags, \
+    compile_exclusion_rules
+from .reference_index import ReferenceIndex
+from .wip_engine import WipSummary
 
 __all__ = [
     'IAImportExport',
@@ -25,9 +45,77 @@ from .raport_from_csv import get_raport_from_csv
 
 _DATETIME_SIMPLE_FORMAT = '%Y-%m-%dT%H:%M:%S'
 
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# коды ответа IA при отсутствии или истечении авторизации
+_AUTH_FAILURE_CODES = (401, 403)
+
+# в этом варианте операции сменного задания и маршрутов с 'н' в обозначении
+# не исключаются
+_EXCLUSION_FLAGS_WITHOUT_N = (
+    'marker_s', 'suffix_ts', 'suffix_mh', 'nop_suffix_1'
+)
+
+# типы заданий, по которым собираются заказы ДСЕ
+_ORDER_TASK_TYPES = ('0',)
+
+_SIMULATION_TASK = 'simulation_operation_task_equipment.simulation_operation_task'
+_SIMULATION_TASKS_URI = (
+    '/rest/collection/simulation_equipment?order_by=simulation_operation_task_equipment.simulation_operation_task.start_date&asc=true&order_by=id&asc=true&order_by=simulation_operation_task_equipment.simulation_operation_task_id&asc=true&with=equipment&with_strict=false&with=equipment_class&with=simulation_operation_task_equipment&with=department&with=simulation_operation_task_equipment.simulation_operation_task&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch&with=simulation_operation_task_equipment.simulation_operation_task.operation&with=simulation_operation_task_equipment.simulation_operation_task.operation.operation_group&with_strict=false&with=simulation_operation_task_equipment.simulation_operation_task.operation.entity_route&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.entity&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.simulation_order_entity_batch&with_strict=false&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.simulation_order_entity_batch.order&with=simulation_operation_task_equipment.simulation_operation_task.operation.operation_entity_route_phase&with_strict=false&'
+)
+
 
 class IAImportExport(Base):
 
+    # таблицы IA, которые читает каждая выгрузка
+    export_tables = {
+        'export_entities': ('entity',),
+        'export_departments': ('department',),
+        'export_ca_equipment': ('equipment_class', 'department'),
+        'export_ca_equipment_new': (
+            'equipment', 'equipment_class', 'department',
+        ),
+        'export_ca_spec': ('entity', 'specification_item'),
+        'export_ca_bom': ('entity', 'specification_item'),
+        'export_ca_routes': ('entity', 'entity_route'),
+        'export_ca_phases': (
+            'entity_route', 'entity_route_phase', 'operation', 'department',
+        ),
+        'export_ca_operations': (
+            'entity', 'entity_route', 'entity_route_phase', 'operation',
+            'department', 'equipment_class',
+        ),
+        'export_ca_daily_tasks': (
+            'entity', 'entity_route_phase', 'operation', 'department',
+        ),
+        'export_ca_wip': (
+            'entity_batch', 'entity', 'entity_route', 'entity_route_phase',
+            'operation', 'department',
+        ),
+        'export_ca_zapasy': (
+            'entity_batch', 'entity', 'entity_route', 'entity_route_phase',
+            'operation', 'department',
+        ),
+        'export_pg_wip': (
+            'entity_batch', 'entity', 'entity_route', 'entity_route_phase',
+            'operation', 'department',
+        ),
+    }
+
+    # выгрузки, которые используют результат других выгрузок:
+    # фазы формируются только для маршрутов, заказы которых собраны
+    # при выгрузке маршрутов
+    export_dependencies = {
+        'export_ca_phases': ('export_ca_routes',),
+    }
+
+    # признаки операций, исключаемых каждой выгрузкой
+    default_exclusion_rules = dict(
+        DEFAULT_EXCLUSION_RULES,
+        ca_operations=_EXCLUSION_FLAGS_WITHOUT_N,
+        ca_daily_tasks=_EXCLUSION_FLAGS_WITHOUT_N,
+    )
+
     def __init__(self, login, password, base_url, erp_fact_csv,
                  erp_plan_csv, phase_name_length, departments_for_pg_plan,
                  task_date, task_time, raport_file, short_phase_name_length,
@@ -42,6 +130,10 @@ class IAImportExport(Base):
 
         self._session = Session()
         self._session.verify = False
+        self._login_lock = Lock()
+        self._login_data = None
+        self._login_expires = None
+        self._wip_lock = Lock()
 
         self.phase_name_length = phase_name_length
         self.short_phase_name_length = short_phase_name_length or 0
@@ -52,20 +144,54 @@ class IAImportExport(Base):
         self.daily_task_period = daily_task_period
         self.employee = employee
 
-        self.entity_orders = defaultdict(set)
+        self._entity_orders = None
+        self._order_expansion = None
+        self._entity_orders_lock = Lock()
+        self._daily_task_lock = Lock()
         self.routes_orders = defaultdict(set)
         self.cache = {}
         self.config = config
-
-        self.collect_orders_from_daily_tasks()
-
-
+        self.page_size = config.get('page_size') or 10000
+        self.fetch_workers = config.get('fetch_workers') or 1
+        self.prefetch_concurrency = config.get('prefetch_concurrency') or 1
+        self._collection_fetcher = None
+        self.timeout = request_timeout(config)
+        self.request_stats = RequestStats()
+        mount_retry_adapter(
+            self._session,
+            config,
+            connection_pool_size(
+                config, self.fetch_workers, self.prefetch_concurrency
+            )
+        )
+        self.stream_json = bool(config.get('stream_json'))
+        self.daily_task_page_size = config.get('daily_task_page_size')
+        self.daily_task_window = config.get('daily_task_window')
+        # сменное задание хранится после сбора заказов, только если его
+        # затем выгружает export_ca_daily_tasks
+        self.keep_daily_tasks = config.get('keep_daily_tasks', True)
+        self.collection_cache = CollectionCache.from_config(config)
+        columnar = config.get('columnar')
+        self.columnar = DEFAULT_PROJECTIONS if columnar is True \
+            else columnar or {}
+        collection_fields = config.get('fields')
+        self.collection_fields = DEFAULT_PROJECTIONS \
+            if collection_fields is True else collection_fields or {}
+        self.fields_param = config.get('fields_param')
+        self.cache_fields = {}
+        self.task_clock = TaskClock.from_config(config)
+        self.exclusion_rules = compile_exclusion_rules(
+            self.default_exclusion_rules,
+            config.get('exclusion_rules')
+        )
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._session.close()
+        for line in self.request_stats.report():
+            self._logger.info(line)
 
     def _make_url(self, uri):
         return urljoin(self._base_url, uri)
@@ -77,41 +203,215 @@ class IAImportExport(Base):
             filename
         )
 
-    def _get_from_rest_collection(self, table):
-        if table not in self.cache:
-            self.cache[table] = []
-            self._perform_login()
-            counter = 0
-            step = 10000
-            if table == 'specification_item':
-                order_by = '&order_by=parent_id&order_by=child_id'
-            elif table == 'operation_profession':
-                order_by = '&order_by=operation_id&order_by=profession_id'
+    def _get_from_rest_collection(self, table, fields=None):
+        # fields -- поля таблицы, нужные вызывающему, по умолчанию берутся
+        # из настройки fields. Если таблица уже загружена без части
+        # полей, она запрашивается заново с объединением наборов полей.
+        # Построенные ранее справочники ReferenceIndex при этом остаются
+        # на старых строках, поэтому поля справочных таблиц лучше задавать
+        # в конфигурации.
+        if fields is None:
+            fields = self.collection_fields.get(table)
+        if table in self.cache:
+            if fields_cover(self.cache_fields[table], fields):
+                return self.cache[table]
+            fields = merge_fields(self.cache_fields[table], fields)
+        rows = None
+        if self.collection_cache:
+            # файл кэша читается один раз: и для проверки срока жизни,
+            # и для инкрементальной синхронизации устаревшей таблицы
+            entry = self.collection_cache.load_entry(table, fields)
+            if self.collection_cache.is_fresh(table, entry):
+                rows = entry['rows']
+                tqdm.write(f'Таблица {table} загружена из кэша')
+            else:
+                rows = self._sync_rest_collection(table, entry)
+        if rows is None:
+            started = time.time()
+            rows = self._fetch_rest_collection(table, fields=fields)
+            if self.collection_cache:
+                self.collection_cache.store(
+                    table, rows, created=started, reconciled=started,
+                    fields=fields
+                )
+        if table in self.columnar:
+            rows = ColumnarTable(rows, self.columnar[table])
+        self.cache_fields[table] = fields
+        self.cache[table] = rows
+        return rows
+
+    def _sync_rest_collection(self, table, entry):
+        sync_config = self.collection_cache.sync_config(table)
+        if sync_config is None:
+            return None
+        if entry is None or 'reconciled' not in entry:
+            return None
+        if entry['rows'] and 'id' not in entry['rows'][0]:
+            return None
+        started = time.time()
+        reconcile = sync_config.get('reconcile') or 24 * 60 * 60
+        if started - entry['reconciled'] > reconcile:
+            tqdm.write(f'Полная сверка таблицы {table}')
+            return None
+
+        watermark = max((row['id'] for row in entry['rows']), default=0)
+        query_filter = f'{{ id gt {watermark} }}'
+        if sync_config.get('timestamp_column'):
+            changed_since = datetime.fromtimestamp(
+                entry['created'] - SYNC_OVERLAP
+            ).strftime(_DATETIME_SIMPLE_FORMAT)
+            query_filter += (
+                f' or {{ {sync_config["timestamp_column"]} '
+                f'ge "{changed_since}" }}'
+            )
+        changed_rows = self._fetch_rest_collection(
+            table, query_filter, entry.get('fields')
+        )
+        tqdm.write(f'Таблица {table}: получено {len(changed_rows)} '
+                   f'новых и измененных строк')
+
+        rows = merge_by_id(entry['rows'], changed_rows)
+        self.collection_cache.store(
+            table, rows, created=started, reconciled=entry['reconciled'],
+            fields=entry.get('fields')
+        )
+        return rows
+
+    def _fetch_rest_collection(self, table, query_filter=None, fields=None):
+        if self._collection_fetcher is not None:
+            return self._collection_fetcher.fetch(table, query_filter, fields)
+        rows = []
+        self._perform_login()
+        step = self.page_size
+        query = self._get_rest_collection_query(table, query_filter, fields)
+        pbar = tqdm(desc=f'Получение данных из таблицы {table}')
+        temp = self._get_rest_collection_page(table, 0, step, query)
+        count = temp['meta']['count']
+        pbar.total = count
+        pbar.update(min(step, count))
+        if table in temp:
+            rows += project_rows(temp[table], fields)
+            starts = range(step, count, step)
+            if self.fetch_workers > 1 and len(starts) > 1:
+                with ThreadPoolExecutor(
+                        max_workers=self.fetch_workers
+                ) as executor:
+                    pages = executor.map(
+                        lambda start: self._get_rest_collection_page(
+                            table, start, step, query
+                        ),
+                        starts
+                    )
+                    for start, page in zip(starts, pages):
+                        pbar.update(min(step, count - start))
+                        rows += project_rows(page.get(table, []), fields)
             else:
-                order_by = '&order_by=id'
-            pbar = tqdm(desc=f'Получение данных из таблицы {table}')
+                for start in starts:
+                    page = self._get_rest_collection_page(
+                        table, start, step, query
+                    )
+                    pbar.update(min(step, count - start))
+                    if table not in page:
+                        break
+                    rows += project_rows(page[table], fields)
+        pbar.close()
+        return rows
+
+    def _get_rest_collection_query(self, table, query_filter=None,
+                                   fields=None):
+        if table == 'specification_item':
+            order_by = '&order_by=parent_id&order_by=child_id'
+        elif table == 'operation_profession':
+            order_by = '&order_by=operation_id&order_by=profession_id'
+        else:
+            order_by = '&order_by=id'
+        query = order_by
+        if query_filter:
+            query += f'&filter={query_filter}'
+        if fields and self.fields_param:
+            query += f'&{self.fields_param}={",".join(fields)}'
+        return query
+
+    def _get_rest_collection_page(self, table, start, step, query):
+        return self._perform_get_collection(
+            f'rest/collection/{table}'
+            f'?start={start}'
+            f'&stop={start + step}'
+            f'{query}',
+            table
+        )
+
+    def _get_main_session(self):
+        return self._perform_get('action/primary_simulation_session')['data']
+
+    def _get_simulation_tasks(self, session, task_types=None):
+        # По умолчанию сменное задание получается одним запросом. Если
+        # задан daily_task_page_size, строки simulation_equipment
+        # запрашиваются страницами, а если задан daily_task_window --
+        # окнами по времени начала операций (в часах). Связанные таблицы
+        # из разных ответов объединяются без повторов.
+        if not (self.daily_task_page_size or self.daily_task_window):
+            query_filter = self._get_simulation_task_filter(
+                session, None, self.daily_task_period, task_types
+            )
+            return self._perform_get_collection(
+                f'{_SIMULATION_TASKS_URI}filter= {query_filter}',
+                'simulation_equipment'
+            )
+        merged = {}
+        pbar = tqdm(desc='Получение сменного задания')
+        for lower, upper in self._get_simulation_task_windows():
+            query_filter = self._get_simulation_task_filter(
+                session, lower, upper, task_types
+            )
+            start = 0
             while True:
-                temp = self._perform_get(
-                    f'rest/collection/{table}'
-                    f'?start={counter}'
-                    f'&stop={counter + step}'
-                    f'{order_by}'
+                paging = ''
+                if self.daily_task_page_size:
+                    paging = (f'start={start}'
+                              f'&stop={start + self.daily_task_page_size}&')
+                page = self._perform_get_collection(
+                    f'{_SIMULATION_TASKS_URI}{paging}filter= {query_filter}',
+                    'simulation_equipment'
                 )
-                pbar.total = temp['meta']['count']
-                counter += step
-                pbar.update(min(
-                    step,
-                    temp['meta']['count'] - (counter - step)
-                ))
-                if table not in temp:
+                merge_collection_payload(merged, page)
+                rows = len(page.get('simulation_equipment', ()))
+                pbar.update(rows)
+                if not self.daily_task_page_size or not rows:
                     break
-                self.cache[table] += temp[table]
-                if counter >= temp['meta']['count']:
+                start += self.daily_task_page_size
+                if start >= page['meta']['count']:
                     break
-        return self.cache[table]
+        pbar.close()
+        return collection_payload_to_lists(merged)
 
-    def _get_main_session(self):
-        return self._perform_get('action/primary_simulation_session')['data']
+    @staticmethod
+    def _get_simulation_task_filter(session, lower, upper, task_types):
+        query_filter = f'{{{_SIMULATION_TASK}.start_time le {upper} }} '
+        if lower is not None:
+            query_filter += (
+                f'and {{{_SIMULATION_TASK}.start_time gt {lower} }} '
+            )
+        query_filter += f'and {{simulation_session_id eq {session} }}'
+        if task_types:
+            query_filter += (
+                f'and {{{_SIMULATION_TASK}.type in '
+                f'{json.dumps(task_types)} }}'
+            )
+        return query_filter
+
+    def _get_simulation_task_windows(self):
+        if not self.daily_task_window:
+            return [(None, self.daily_task_period)]
+        period = float(self.daily_task_period)
+        windows = []
+        lower = None
+        upper = 0
+        while upper < period:
+            upper = min(upper + self.daily_task_window, period)
+            windows.append((lower, upper))
+            lower = upper
+        return windows
 
     def _perform_json_request(self, http_method, uri, **kwargs):
         url = self._make_url(uri)
@@ -122,15 +422,14 @@ class IAImportExport(Base):
 
         logger.debug('Отправляемые данные: {!r}.'.format(kwargs))
 
-        response = self._session.request(http_method,
-                                         url=url,
-                                         **kwargs)
+        response = self._request_with_auth(http_method, url, **kwargs)
         try:
             response_json = response.json()
         except JSONDecodeError:
             logger.error('Получен ответ на {} запрос по ссылке {!r}: '
-                         '{!r}'.format(http_method, url, response))
-            raise JSONDecodeError
+                         '{!r} {!r}'.format(http_method, url, response,
+                                            response.text[:1000]))
+            raise
 
         logger.debug('Получен ответ на {} запрос по ссылке {!r}: '
                      '{!r}'.format(http_method, url, response_json))
@@ -138,6 +437,30 @@ class IAImportExport(Base):
 
     _perform_get = partialmethod(_perform_json_request, 'GET')
 
+    def _perform_get_stream(self, uri, table):
+        url = self._make_url(uri)
+        self._logger.debug('Выполнение потокового GET запроса '
+                           'по ссылке {!r}.'.format(url))
+        response = self._request_with_auth('GET', url, stream=True)
+
+        def iter_content():
+            with response:
+                yield from response.iter_content(_STREAM_CHUNK_SIZE)
+
+        return JSONCollectionStream(iter_content(), table)
+
+    def _perform_get_collection(self, uri, table):
+        # В режиме stream_json ответ разбирается по мере получения и не
+        # хранится в памяти одновременно с построенными из него строками.
+        if not self.stream_json:
+            return self._perform_get(uri)
+        try:
+            return self._perform_get_stream(uri, table).to_dict()
+        except JSONDecodeError:
+            self._logger.error('Не удалось разобрать ответ на GET запрос '
+                               'по ссылке {!r}.'.format(self._make_url(uri)))
+            raise
+
     def _perform_post(self, uri, data):
         return self._perform_json_request('POST', uri, json=data)
 
@@ -151,57 +474,129 @@ class IAImportExport(Base):
         )
 
     def _perform_login(self):
-        return self._perform_action(
-            'login',
-            data={
-                'login': self._login,
-                'password': self._password
-            },
-            action='login'
-        )['data']
-
-    def get_phase_with_operation_id(self, operation_id):
-
-        if 'phase_identity' in self.cache:
-            return self.cache['phase_identity'].get(operation_id)
-
-        self.cache['phase_identity'] = {}
-
-        entity_routes_dict = list_to_dict(
-            self._get_from_rest_collection('entity_route')
-        )
-
-        operation_dict = list_to_dict(sorted(
-            self._get_from_rest_collection('operation'),
-            key=lambda k: k['nop']
-        ))
+        # Вход выполняется один раз за сессию и повторяется только после
+        # истечения срока действия cookie или отказа сервера в доступе.
+        with self._login_lock:
+            if self._login_data is not None and (
+                    self._login_expires is None or
+                    time.time() < self._login_expires
+            ):
+                return self._login_data
+            self._login_data = None
+            login_data = self._perform_action(
+                'login',
+                data={
+                    'login': self._login,
+                    'password': self._password
+                },
+                action='login'
+            )['data']
+            self._login_expires = min(
+                (cookie.expires for cookie in self._session.cookies
+                 if cookie.expires),
+                default=None
+            )
+            self._login_data = login_data
+            return login_data
+
+    def _reauthenticate(self, login_data):
+        with self._login_lock:
+            # сессию мог уже обновить другой поток
+            if self._login_data is login_data:
+                self._login_data = None
+        self._logger.info('Повторная авторизация в IA')
+        self._perform_login()
 
-        entity_routes_phases_dict = list_to_dict(
-            self._get_from_rest_collection('entity_route_phase')
-        )
+    def _request_with_auth(self, http_method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        login_data = self._login_data
+        response = self._send_request(http_method, url, **kwargs)
+        if response.status_code in _AUTH_FAILURE_CODES and \
+                login_data is not None:
+            response.close()
+            self._reauthenticate(login_data)
+            response = self._send_request(http_method, url, **kwargs)
+        return response
+
+    def _send_request(self, http_method, url, **kwargs):
+        # Для потоковых запросов учитывается время до получения заголовков
+        started = time.perf_counter()
+        response = self._session.request(http_method, url=url, **kwargs)
+        elapsed = time.perf_counter() - started
+        self.request_stats.add(url, elapsed)
+        self._logger.debug('{} запрос по ссылке {!r} выполнен '
+                           'за {:.2f} с.'.format(http_method, url, elapsed))
+        return response
+
+    @property
+    def reference(self):
+        if 'reference_index' not in self.cache:
+            self.cache['reference_index'] = ReferenceIndex(
+                self._get_from_rest_collection
+            )
+        return self.cache['reference_index']
+
+    @property
+    def wip_summary(self):
+        # итоги по НЗП считаются один раз для всех выгрузок НЗП
+        with self._wip_lock:
+            if 'wip_summary' not in self.cache:
+                self.cache['wip_summary'] = WipSummary(
+                    self._get_from_rest_collection('entity_batch'),
+                    self.reference,
+                    self.get_entity_last_phase
+                )
+        return self.cache['wip_summary']
 
-        for op_id, operation in operation_dict.items():
-            if operation['entity_route_phase_id'] is None:
-                if '(' not in operation['identity']:
-                    tqdm.write(f'Не найдена фаза для '
-                               f'операции {operation["identity"]}')
-                continue
-            self.cache['phase_identity'][op_id] = entity_routes_phases_dict[
-                operation['entity_route_phase_id']
-            ]['identity']
+    def prefetch(self, methods):
+        self._perform_login()
+        tables = []
+        for method in methods:
+            for table in self.export_tables.get(method, ()):
+                if table not in tables:
+                    tables.append(table)
+        if self.prefetch_concurrency > 1:
+            AsyncCollectionFetcher(self, self.prefetch_concurrency).prefetch(
+                tables
+            )
+        else:
+            for table in tables:
+                self._get_from_rest_collection(table)
+        self.reference.warm(tables)
+
+    def iter_export(self, method):
+        # Для выгрузок, у которых есть потоковый вариант iter_*, записи
+        # отдаются по мере формирования, для остальных -- готовым списком.
+        iter_method = getattr(self, method.replace('export_', 'iter_', 1), None)
+        if iter_method is None:
+            return iter(getattr(self, method)())
+        return iter_method()
+
+    def excluded_operations(self, rule, operations=None):
+        # id операций, исключаемых правилом rule. По умолчанию признаки
+        # берутся из справочника операций, строки операций из других
+        # ответов IA (например, сменного задания) передаются в operations.
+        flags = self.exclusion_rules[rule]
+        if operations is None:
+            return self.reference.operation_flags.excluded(flags)
+        return OperationFlags(operations).excluded(flags)
 
-        return self.cache['phase_identity'].get(operation_id)
+    def get_phase_with_operation_id(self, operation_id):
+        return self.reference.phase_identity.get(operation_id)
 
     def export_entities(self):
+        return list(self.iter_entities())
+
+    def iter_entities(self):
         self._perform_login()
-        return [
-            {
-                'identity': f"{order}_{entity['identity']}",
-                'name': entity['name'],
-                'vendorCode': f"{order}_{entity['identity']}"
-            } for entity in self._get_from_rest_collection('entity')
-            for order in self.entity_orders[entity['identity']]
-        ]
+        expansion = self.order_expansion
+        for entity in self._get_from_rest_collection('entity'):
+            for _, identity in expansion.expand(entity['identity']):
+                yield {
+                    'identity': identity,
+                    'name': entity['name'],
+                    'vendorCode': identity
+                }
 
     def export_departments(self):
         self._perform_login()
@@ -215,9 +610,7 @@ class IAImportExport(Base):
     def export_ca_equipment(self):
         self._perform_login()
         equipment = self._get_from_rest_collection('equipment_class')
-        departments_dict = list_to_dict(
-            self._get_from_rest_collection('department')
-        )
+        departments_dict = self.reference.departments
         report = []
         for row in equipment:
             if row['name'] != 'Контроль':
@@ -235,9 +628,7 @@ class IAImportExport(Base):
     def export_ca_equipment_new(self):
         self._perform_login()
         equipment = self._get_from_rest_collection('equipment')
-        departments_dict = list_to_dict(
-            self._get_from_rest_collection('department')
-        )
+        departments_dict = self.reference.departments
         equipment_class_dict = list_to_dict(
             self._get_from_rest_collection('equipment_class')
         )
@@ -278,66 +669,104 @@ class IAImportExport(Base):
         return report
 
     def export_ca_spec(self):
-        self._perform_login()
-        entities_dict = list_to_dict(self._get_from_rest_collection('entity'))
-        specification = self._get_from_rest_collection('specification_item')
-
-        spec = defaultdict(list)
-        for row in specification:
-            for order in self.entity_orders[row['parent_id']['identity']]:
-                spec[f"{order}_{entities_dict[row['parent_id']]['identity']}"].append({
-                    'assemblyElementIdentity': f"{order}_{row[entities_dict[row['child_id']]['identity']]}",
-                    'quantityAssemblyElement': row['amount']
-                })
+        return list(self.iter_ca_spec())
 
-        return [{
-            'identity': parent,
-            'parentAssemblyElementIdentity': parent,
-            'items': spec[parent]
-        } for parent in spec]
+    def iter_ca_spec(self):
+        self._perform_login()
+        entities_dict = self.reference.entities
+        expansion = self.order_expansion
+
+        # строки спецификации группируются по родителю, а записи для
+        # каждого заказа родителя формируются уже при выдаче
+        children = defaultdict(list)
+        for row in self._get_from_rest_collection('specification_item'):
+            children[row['parent_id']].append(row)
+
+        for parent_id, rows in children.items():
+            parent_identity = entities_dict[parent_id]['identity']
+            for order, parent in expansion.expand(parent_identity):
+                yield {
+                    'identity': parent,
+                    'parentAssemblyElementIdentity': parent,
+                    'items': [{
+                        'assemblyElementIdentity': expansion.entity_identity(
+                            order, entities_dict[row['child_id']]['identity']
+                        ),
+                        'quantityAssemblyElement': row['amount']
+                    } for row in rows]
+                }
+
+    def export_ca_bom(self):
+        return list(self.iter_ca_bom())
+
+    def iter_ca_bom(self):
+        # Состав верхнеуровневых сборок по всем уровням спецификации,
+        # для каждого заказа сборки. Сборки, из которых достижим цикл,
+        # не выгружаются.
+        self._perform_login()
+        entities_dict = self.reference.entities
+        expansion = self.order_expansion
+        bom = self.reference.bom
+        for cycle in bom.cycles():
+            tqdm.write('Цикл в спецификации: {}'.format(' -> '.join(
+                entities_dict[entity_id]['identity'] for entity_id in cycle
+            )))
+
+        for entity_id in bom.roots:
+            try:
+                totals = bom.totals(entity_id)
+            except BomCycleError:
+                continue
+            items = [
+                (entities_dict[item_id]['identity'], quantity)
+                for item_id, quantity in totals.items()
+            ]
+            parent_identity = entities_dict[entity_id]['identity']
+            for order, parent in expansion.expand(parent_identity):
+                yield {
+                    'identity': parent,
+                    'parentAssemblyElementIdentity': parent,
+                    'items': [{
+                        'assemblyElementIdentity':
+                            expansion.entity_identity(order, identity),
+                        'quantityAssemblyElement': quantity
+                    } for identity, quantity in items]
+                }
 
     def export_ca_routes(self):
+        return list(self.iter_ca_routes())
+
+    def iter_ca_routes(self):
         self._perform_login()
-        entity_dict = list_to_dict(
-            self._get_from_rest_collection('entity')
-        )
+        entity_dict = self.reference.entities
+        expansion = self.order_expansion
         routes = self._get_from_rest_collection('entity_route')
 
-        report = []
         for row in routes:
-            for order in self.entity_orders[entity_dict[row['entity_id']]['identity']]:
-                report.append(
-                    {
-                        'identity': f"{order}_{row['identity']}",
-                        'assemblyElementIdentity': f"{order}_{entity_dict[row['entity_id']]['identity']}",
-                        'name': row['identity'],
-                    }
-                )
+            entity_identity = entity_dict[row['entity_id']]['identity']
+            for order, assembly_identity in expansion.expand(entity_identity):
                 self.routes_orders[row['identity']].add(order)
-
-        return report
+                yield {
+                    'identity': f"{order}_{row['identity']}",
+                    'assemblyElementIdentity': assembly_identity,
+                    'name': row['identity'],
+                }
 
     def export_ca_phases(self):
 
         self._perform_login()
-        entity_routes_dict = list_to_dict(
-            self._get_from_rest_collection('entity_route')
-        )
-        operations = sorted(
-            self._get_from_rest_collection('operation'),
-            key=lambda k: k['nop']
-        )
-        departments_dict = list_to_dict(
-            self._get_from_rest_collection('department')
-        )
+        entity_routes_dict = self.reference.entity_routes
+        operations = self.reference.operations_by_nop
+        departments_dict = self.reference.departments
 
         phase_route = {}
         route_step = {}
         report = []
         unique_identities = set()
 
+        excluded_operations = self.excluded_operations('ca_phases')
         for row in tqdm(operations):
-            if 'н' in row['identity'] or 'с' in row['identity']:
+            if row['id'] in excluded_operations:
                 continue
             entity_route_id = row['entity_route_id']
             phase_identity = self.get_phase_with_operation_id(
@@ -384,39 +813,25 @@ class IAImportExport(Base):
         return report
 
     def export_ca_operations(self):
+        return list(self.iter_ca_operations())
 
-        self._perform_login()
-        entity_dict = list_to_dict(
-            self._get_from_rest_collection('entity')
-        )
-        entity_routes_dict = list_to_dict(
-            self._get_from_rest_collection('entity_route')
-        )
-        operations = sorted(
-            self._get_from_rest_collection('operation'),
-            key=lambda k: k['nop']
-        )
-        departments_dict = list_to_dict(
-            self._get_from_rest_collection('department')
-        )
-        equipment_class_dict = list_to_dict(
-            self._get_from_rest_collection('equipment_class')
-        )
+    def iter_ca_operations(self):
 
-        operations_filtered = list(
-            filter(
-                lambda x: ('с' not in x['identity']) and
-                          # ('н' not in x['identity']) and
-                          (x['identity'][-1:] != 'Ц') and
-                          (x['nop'][-2:] != '_1') and
-                          (x['identity'][-2:] != 'MH') and
-                          (x['identity'][-2:] != 'МН'),
-                operations
-            )
-        )
+        self._perform_login()
+        entity_dict = self.reference.entities
+        entity_routes_dict = self.reference.entity_routes
+        operations = self.reference.operations_by_nop
+        departments_dict = self.reference.departments
+        equipment_class_dict = self.reference.equipment_classes
+
+        excluded_operations = self.excluded_operations('ca_operations')
+        operations_filtered = [
+            row for row in operations
+            if row['id'] not in excluded_operations
+        ]
 
-        report = []
         operation_priority = {}
+        expansion = self.order_expansion
 
         for row in tqdm(operations_filtered):
             entity_route_id = row['entity_route_id']
@@ -443,7 +858,9 @@ class IAImportExport(Base):
                 row['nop'].split('_')[-1]
             )
 
-            for order in self.entity_orders[entity_dict[entity_id]['identity']]:
+            for order, assembly_identity in expansion.expand(
+                    entity_dict[entity_id]['identity']
+            ):
                 if row['setup_time'] != 0:
                     op_name = f"Наладка_{row['name']}"
                     op_num = f"{row['nop']}H"
@@ -460,10 +877,10 @@ class IAImportExport(Base):
                     op_time = round(row['prod_time'] / 60 / 60 * 10000) / 10000
                     op_identity = f"{order}_{operation_identity}"
 
-                report.append({
+                yield {
                     'identity': op_identity,
                     'transitionIdentity': f"{order}_{phase_identity}",
-                    'assemblyElementIdentity': f"{order}_{entity_dict[entity_id]['identity']}",
+                    'assemblyElementIdentity': assembly_identity,
                     'departmentIdentity':
                         departments_dict[department_id]['identity'],
                     'workCenterIdentity':
@@ -475,41 +892,82 @@ class IAImportExport(Base):
                     'priority': operation_priority[entity_route_id],
                     'name': op_name,
                     'pieceTime': op_time
-                })
+                }
+
+    @property
+    def entity_orders(self):
+        # заказы собираются при первом обращении из того же сменного
+        # задания, которое затем использует export_ca_daily_tasks
+        with self._entity_orders_lock:
+            if self._entity_orders is None:
+                self._entity_orders = self.collect_orders_from_daily_tasks()
+        return self._entity_orders
+
+    @property
+    def order_expansion(self):
+        # обозначения с префиксом заказа общие для выгрузок ДСЕ,
+        # спецификаций, маршрутов и операций одной сессии
+        orders = self.entity_orders
+        with self._entity_orders_lock:
+            if self._order_expansion is None:
+                self._order_expansion = OrderExpansion(orders)
+        return self._order_expansion
+
+    def _get_daily_task_payload(self, release=False, task_types=None):
+        # Сменное задание запрашивается один раз за сессию. release=True
+        # отдает его последнему потребителю и освобождает память.
+        # task_types ограничивает типы заданий на сервере IA; задается,
+        # только если сменное задание больше никому не нужно.
+        with self._daily_task_lock:
+            if 'daily_tasks' not in self.cache:
+                self._perform_login()
+                if self.config.get('session'):
+                    session = self.config.get('session')
+                else:
+                    session = self._get_main_session()
 
-        return report
+                tqdm.write(f"Получаем сменное задание "
+                           f"на {self.daily_task_period} часов "
+                           f"из сессии {session}")
+
+                self.cache['daily_tasks'] = self._get_simulation_tasks(
+                    session, task_types
+                )
+            if release:
+                return self.cache.pop('daily_tasks')
+            return self.cache['daily_tasks']
 
     def collect_orders_from_daily_tasks(self):
         self._perform_login()
-        entities_dict = list_to_dict(
-            self._get_from_rest_collection('entity')
-        )
-
-        if self.config.get('session'):
-            session = self.config.get('session')
+        entities_dict = self.reference.entities
+        entity_orders = defaultdict(set)
+
+        # если сменное задание не выгружается, заказы собираются по
+        # запросу только заданий типа 0, как раньше; иначе задание
+        # запрашивается целиком и тип 0 отбирается ниже
+        if self.keep_daily_tasks:
+            tasks = self._get_daily_task_payload()
         else:
-            session = self._get_main_session()
-
-        tqdm.write(f"Получаем сменное задание "
-                   f"на {self.daily_task_period} часов из сессии {session}")
-
-        tasks = self._perform_get(
-            '/rest/collection/simulation_equipment?order_by=simulation_operation_task_equipment.simulation_operation_task.start_date&asc=true&order_by=id&asc=true&order_by=simulation_operation_task_equipment.simulation_operation_task_id&asc=true&with=equipment&with_strict=false&with=equipment_class&with=simulation_operation_task_equipment&with=department&with=simulation_operation_task_equipment.simulation_operation_task&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch&with=simulation_operation_task_equipment.simulation_operation_task.operation&with=simulation_operation_task_equipment.simulation_operation_task.operation.operation_group&with_strict=false&with=simulation_operation_task_equipment.simulation_operation_task.operation.entity_route&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.entity&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.simulation_order_entity_batch&with_strict=false&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.simulation_order_entity_batch.order&with=simulation_operation_task_equipment.simulation_operation_task.operation.operation_entity_route_phase&with_strict=false&'
-            'filter= {{simulation_operation_task_equipment.simulation_operation_task.start_time le {} }} '
-            'and {{simulation_session_id eq {} }}'
-            'and {{simulation_operation_task_equipment.simulation_operation_task.type in ["0"] }}'.format(
-                self.daily_task_period, session)
-        )
+            tasks = self._get_daily_task_payload(
+                release=True, task_types=list(_ORDER_TASK_TYPES)
+            )
         order_dict = list_to_dict(tasks['order'])
         operation_dict = list_to_dict(tasks['operation'])
+        excluded_operations = self.excluded_operations(
+            'daily_task_orders', tasks['operation']
+        )
         entity_routes_dict = list_to_dict(tasks['entity_route'])
-        department_dict = list_to_dict(self._get_from_rest_collection('department'))
+        department_dict = self.reference.departments
         simulation_entity_batch_dict = list_to_dict(tasks['simulation_entity_batch'])
         simulation_order_entity_batch_dict = list_to_dict(tasks['simulation_order_entity_batch'], column='simulation_entity_batch_id')
 
         operation_entity_dict = {}
-        today = datetime.strftime(datetime.now(), '%Y-%m-%d')
+        clock = self.task_clock
+        today_day = clock.today()
         for row in tasks['simulation_operation_task']:
+            # заказы собираются только по заданиям с типом 0
+            if str(row['type']) not in _ORDER_TASK_TYPES:
+                continue
             entity_route_id = operation_dict[row['operation_id']][
                 'entity_route_id']
             nop = operation_dict[row['operation_id']]['nop']
@@ -521,17 +979,7 @@ class IAImportExport(Base):
                 if department_dict[operation_dict[row['operation_id']]['department_id']]['identity'] not in self.config[
                     'only_dept']:
                     continue
-            if 'Ц' == operation_dict[row['operation_id']]['identity'][-1:]:
-                continue
-            if '_1' == operation_dict[row['operation_id']]['nop'][-2:]:
-                continue
-            if 'МН' == operation_dict[row['operation_id']]['identity'][-2:]:
-                continue
-            if 'MH' == operation_dict[row['operation_id']]['identity'][-2:]:
-                continue
-            if 'н' in operation_dict[row['operation_id']]['identity']:
-                continue
-            if 'с' in operation_dict[row['operation_id']]['identity']:
+            if row['operation_id'] in excluded_operations:
                 continue
 
             entity_id = entity_routes_dict[entity_route_id]['entity_id']
@@ -550,19 +998,7 @@ class IAImportExport(Base):
             operation_entity_dict[operation_identity] = \
                 entities_dict[entity_id]['identity']
 
-            try:
-                task_date = (datetime.strptime(
-                    row['start_date'],
-                    '%Y-%m-%dT%H:%M:%S.%f%z'
-                ) - timedelta(3 / 24)).replace(tzinfo=None)
-            except ValueError:
-                task_date = (datetime.strptime(
-                    row['start_date'],
-                    '%Y-%m-%dT%H:%M:%S%z'
-                ) - timedelta(3 / 24)).replace(tzinfo=None)
-
-            task_date = datetime.strftime(task_date, '%Y-%m-%d')
-            if task_date < today:
+            if clock.day(row['start_date']) < today_day:
                 continue
 
             # simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.simulation_order_entity_batch.order
@@ -571,38 +1007,34 @@ class IAImportExport(Base):
                     row['simulation_entity_batch_id']
                 ]['id']]['order_id']
             ]['name'][:9]
-            self.entity_orders[entities_dict[entity_id]['identity']].add(order)
+            entity_orders[entities_dict[entity_id]['identity']].add(order)
 
-    def export_ca_daily_tasks(self):
+        return entity_orders
 
-        self._perform_login()
+    def export_ca_daily_tasks(self):
+        return list(self.iter_ca_daily_tasks())
 
-        entities_dict = list_to_dict(
-            self._get_from_rest_collection('entity')
-        )
+    def iter_ca_daily_tasks(self):
 
-        if self.config.get('session'):
-            session = self.config.get('session')
-        else:
-            session = self._get_main_session()
+        self._perform_login()
 
-        tqdm.write(f"Получаем сменное задание "
-                   f"на {self.daily_task_period} часов из сессии {session}")
+        entities_dict = self.reference.entities
 
-        tasks = self._perform_get(
-            '/rest/collection/simulation_equipment?order_by=simulation_operation_task_equipment.simulation_operation_task.start_date&asc=true&order_by=id&asc=true&order_by=simulation_operation_task_equipment.simulation_operation_task_id&asc=true&with=equipment&with_strict=false&with=equipment_class&with=simulation_operation_task_equipment&with=department&with=simulation_operation_task_equipment.simulation_operation_task&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch&with=simulation_operation_task_equipment.simulation_operation_task.operation&with=simulation_operation_task_equipment.simulation_operation_task.operation.operation_group&with_strict=false&with=simulation_operation_task_equipment.simulation_operation_task.operation.entity_route&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.entity&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.simulation_order_entity_batch&with_strict=false&with=simulation_operation_task_equipment.simulation_operation_task.simulation_entity_batch.simulation_order_entity_batch.order&with=simulation_operation_task_equipment.simulation_operation_task.operation.operation_entity_route_phase&with_strict=false&'
-            'filter= {{simulation_operation_task_equipment.simulation_operation_task.start_time le {} }} '
-            'and {{simulation_session_id eq {} }}'.format(
-                self.daily_task_period, session)
-        )
+        # заказы собираются до освобождения сменного задания, чтобы
+        # не запрашивать его повторно
+        self.entity_orders
+        tasks = self._get_daily_task_payload(release=True)
 
         order_dict = list_to_dict(tasks['order'])
         simulation_equipment_dict = list_to_dict(tasks['simulation_equipment'])
         simulation_operation_task_equipment_dict = list_to_dict(tasks['simulation_operation_task_equipment'],
                                                                 'simulation_operation_task_id')
         operation_dict = list_to_dict(tasks['operation'])
+        excluded_operations = self.excluded_operations(
+            'ca_daily_tasks', tasks['operation']
+        )
         entity_routes_dict = list_to_dict(tasks['entity_route'])
-        department_dict = list_to_dict(self._get_from_rest_collection('department'))
+        department_dict = self.reference.departments
         equipment_dict = list_to_dict(tasks['equipment'])
         equipment_class_dict = list_to_dict(tasks['equipment_class'])
         simulation_entity_batch_dict = list_to_dict(tasks['simulation_entity_batch'])
@@ -624,7 +1056,9 @@ class IAImportExport(Base):
         )
 
         operation_entity_dict = {}
-        today = datetime.strftime(datetime.now(), '%Y-%m-%d')
+        clock = self.task_clock
+        today_day = clock.today()
+        today = clock.day_label(today_day)
         for row in tasks['simulation_operation_task']:
             entity_route_id = operation_dict[row['operation_id']][
                 'entity_route_id']
@@ -637,17 +1071,7 @@ class IAImportExport(Base):
                 if department_dict[operation_dict[row['operation_id']]['department_id']]['identity'] not in self.config[
                     'only_dept']:
                     continue
-            if 'Ц' == operation_dict[row['operation_id']]['identity'][-1:]:
-                continue
-            if '_1' == operation_dict[row['operation_id']]['nop'][-2:]:
-                continue
-            if 'МН' == operation_dict[row['operation_id']]['identity'][-2:]:
-                continue
-            if 'MH' == operation_dict[row['operation_id']]['identity'][-2:]:
-                continue
-            # if 'н' in operation_dict[row['operation_id']]['identity']:
-            #     continue
-            if 'с' in operation_dict[row['operation_id']]['identity']:
+            if row['operation_id'] in excluded_operations:
                 continue
 
             entity_id = entity_routes_dict[entity_route_id]['entity_id']
@@ -683,24 +1107,11 @@ class IAImportExport(Base):
             operation_entity_dict[operation_identity] = \
                 entities_dict[entity_id]['identity']
 
-            try:
-                task_date = (datetime.strptime(
-                    row['start_date'],
-                    '%Y-%m-%dT%H:%M:%S.%f%z'
-                ) - timedelta(3 / 24)).replace(tzinfo=None)
-            except ValueError:
-                task_date = (datetime.strptime(
-                    row['start_date'],
-                    '%Y-%m-%dT%H:%M:%S%z'
-                ) - timedelta(3 / 24)).replace(tzinfo=None)
-
-            if task_date.hour >= 12:
-                task_time = '19:00:00'
-            else:
-                task_time = '07:00:00'
-            task_date = datetime.strftime(task_date, '%Y-%m-%d')
-            if task_date < today:
+            task_day, task_shift = clock.day_shift(row['start_date'])
+            if task_day < today_day:
                 continue
+            task_date = clock.day_label(task_day)
+            task_time = clock.shift_label(task_shift)
 
             report[order][operation_identity][task_date][task_time] += floor(
                 row['entity_amount'] * (row['stop_labor'] or 1)
@@ -773,6 +1184,13 @@ class IAImportExport(Base):
         #                     }
         #                 }
 
+        # сырые данные сменного задания больше не нужны
+        del tasks, simulation_equipment_dict, \
+            simulation_operation_task_equipment_dict, operation_dict, \
+            entity_routes_dict, equipment_dict, equipment_class_dict, \
+            order_dict, simulation_entity_batch_dict, \
+            simulation_order_entity_batch_dict
+
         result= {
             f'{order}_{task_date}_{task_time}_{operation}':
                 {
@@ -794,80 +1212,33 @@ class IAImportExport(Base):
             for task_time in report[order][operation][task_date]
         }
 
-        try:
-            with open(
-                    "tasks.csv.bak",
-                    'r'
-            ) as all_positions:
-                data = csv.DictReader(all_positions)
-                for row in data:
-                    if row['dateBegin'] < today:
-                        continue
-                    if row['identity'] not in result:
-                        result[row['identity']] = {
-                            key: value for key, value in row.items()
-                        }
-                        result[row['identity']]['quantityPlan'] = 0
-                        result[row['identity']]['equipments'] = None
-        except FileNotFoundError:
-            pass
-
-        keys = list(result.values())[0].keys()
-
-        with open(
-                "tasks.csv.bak",
-                mode='w',
-                newline=''
-        ) as output_file:
-            dict_writer = csv.DictWriter(output_file, keys)
-            dict_writer.writeheader()
-            dict_writer.writerows(list(result.values()))
-
-        return list(dict(sorted(result.items())).values())
+        # задания из прошлых выгрузок, пропавшие из сменного задания,
+        # отправляются с нулевым количеством
+        with TaskStore.from_config(self.config) as task_store:
+            task_store.prune(today)
+            for row in task_store.disappeared(result):
+                result[row['identity']] = dict(
+                    row, quantityPlan=0, equipments=None
+                )
+            task_store.save(result.values())
+
+        for identity in sorted(result):
+            yield result[identity]
 
     def export_ca_wip(self):
 
         self._perform_login()
 
-        wip_batches = self._get_from_rest_collection('entity_batch')
-
-        entity_routes = list_to_dict(
-            self._get_from_rest_collection('entity_route')
-        )
-
-        main_routes = {
-            entity_routes[entity_route_id]['entity_id']:
-                entity_routes[entity_route_id]['identity']
-            for entity_route_id in filter(
-                lambda x: entity_routes[x]['alternate'] is False, entity_routes
-            )
-        }
+        wip = self.wip_summary
 
         cur_date = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-        not_report = defaultdict(float)
-        department = {}
-        for row in wip_batches:
-            if row['operation_id'] is None:
-                if row['operation_progress'] == 0:
-                    continue
-                if row['entity_id'] not in main_routes:
-                    continue
-                transition_identity = self.get_entity_last_phase(
-                    row['entity_id']
-                )
-            else:
-                transition_identity = self.get_phase_with_operation_id(
-                    row['operation_id']
-                )
-            not_report[transition_identity] += row['amount']
-            department[transition_identity] = row["identity"][-4:]
         report = [{
             'identity': f'{cur_date}_{key}',
-            'departmentIdentity': department[key],
+            'departmentIdentity': wip.wip_departments[key],
             'transitionIdentity': key,
             'quantity': round(value),
             'dateTime': cur_date
-        } for key, value in not_report.items()]
+        } for key, value in wip.wip_totals.items()]
 
         return report
 
@@ -875,189 +1246,53 @@ class IAImportExport(Base):
 
         self._perform_login()
 
-        wip_batches = self._get_from_rest_collection('entity_batch')
-
-        entity_routes = list_to_dict(
-            self._get_from_rest_collection('entity_route')
-        )
-
-        departments = list_to_dict(
-            self._get_from_rest_collection('department')
-        )
-
-        operations = list_to_dict(
-            self._get_from_rest_collection('operation')
-        )
-
-        entities = list_to_dict(
-            self._get_from_rest_collection('entity')
-        )
-
-        main_routes = {
-            entity_routes[entity_route_id]['entity_id']:
-                entity_routes[entity_route_id]['identity']
-            for entity_route_id in filter(
-                lambda x: entity_routes[x]['alternate'] is False, entity_routes
-            )
-        }
+        wip = self.wip_summary
 
-        report_temp = defaultdict(float)
-        for row in wip_batches:
-            if row['operation_id'] is None:
-                if row['operation_progress'] == 0:
-                    continue
-                if row['entity_id'] not in main_routes:
-                    continue
-                transition_identity = self.get_entity_last_phase(
-                    row['entity_id']
-                )
-            else:
-                transition_identity = self.get_phase_with_operation_id(
-                    row['operation_id']
-                )
-            try:
-                report_temp[
-                    f"{transition_identity}|" \
-                    f"{departments[operations[row['operation_id']]['department_id']]['identity']}|" \
-                    f"{entities[row['entity_id']]['identity']}"
-                ] += row['amount']
-            except KeyError:
-                report_temp[
-                    f"{transition_identity}|" \
-                    f"02904|" \
-                    f"{entities[row['entity_id']]['identity']}"
-                ] += row['amount']
-                print(f"{row['identity']} - партия отправлена на 02904")
-                pass
-            # report.append({
-            #     'identity': row['identity'],
-            #     'departmentIdentity': departments[operations[row['operation_id']]['department_id']]['identity'],
-            #     'assemblyElementIdentity': entities[row['entity_id']][
-            #         'identity'],
-            #     'transitionIdentity': transition_identity,
-            #     'quantityAssemblyElement': round(row['amount']),
-            # })
-            # report.append({
-            #     'identity': row['identity'],
-            #     'departmentIdentity': row['identity'][-4:],
-            #     'assemblyElementIdentity': entities[row['entity_id']][
-            #         'identity'],
-            #     'transitionIdentity': transition_identity,
-            #     'quantityAssemblyElement': round(row['amount']),
-            # })
+        for identity in wip.stock_redirected:
+            print(f"{identity} - партия отправлена на 02904")
         report = [{
-            'identity': key,
-            'departmentIdentity': key.split('|')[1],
-            'assemblyElementIdentity': key.split('|')[2],
-            'transitionIdentity': key.split('|')[0],
+            'identity': f'{transition_identity}|{department}|{entity}',
+            'departmentIdentity': department,
+            'assemblyElementIdentity': entity,
+            'transitionIdentity': f'{transition_identity}',
             'quantityAssemblyElement': value,
 
-        } for key, value in report_temp.items()]
+        } for (transition_identity, department, entity), value
+            in wip.stock_totals.items()]
         return report
 
     def export_pg_wip(self):
         logger = self._logger
         self._perform_login()
 
-        wip_batches = self._get_from_rest_collection('entity_batch')
-
-        operations = sorted(
-            self._get_from_rest_collection('operation'),
-            key=lambda x: x['nop']
-        )
-        last_operations_entity_route_id = {}
-        for row in operations:
-            last_operations_entity_route_id[row['entity_route_id']] = row
-
-        entity_routes = self._get_from_rest_collection('entity_route')
+        wip = self.wip_summary
 
-        main_routes = {
-            entity_route['entity_id']: entity_route
-            for entity_route in filter(
-                lambda x: x['alternate'] is False,
-                entity_routes
+        for entity_id in wip.pg_missing_routes:
+            logger.info(
+                'Отсутствует маршрут для номенклатуры {}'.format(entity_id)
             )
-        }
-
-        not_report = defaultdict(float)
-        department = {}
         cur_date = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-
-        for row in tqdm(wip_batches, desc='Разбор партий НЗП'):
-            if row['entity_batch_snapshot_id'] is not None:
-                continue
-            if row['operation_id'] is None:
-                if row['operation_progress'] == 0:
-                    continue
-                if row['entity_id'] not in main_routes:
-                    continue
-                transition_identity = self.get_entity_last_phase(
-                    row['entity_id'],
-                )
-            else:
-                transition_identity = self.get_phase_with_operation_id(
-                    row['operation_id']
-                )
-            if transition_identity is None:
-                logger.info(
-                    'Отсутствует маршрут для номенклатуры {}'.format(
-                        row['entity_id']
-                    )
-                )
-                continue
-            not_report[transition_identity] += row['amount']
-            department[transition_identity] = row["identity"][-4:]
         report = [{
             'identity': f'{cur_date[:10]}_{key}',
             # временно подставили какое попало подразделение
-            'warehouse': department[key],
+            'warehouse': wip.pg_departments[key],
             'transitionIdentity': key,
             'quantity': round(value),
             'date': cur_date[:10]
-        } for key, value in not_report.items()]
+        } for key, value in wip.pg_totals.items()]
 
         return report
 
     def get_entity_last_phase(self, entity_id):
-        if 'main_routes' not in self.cache:
-            entity_routes = self._get_from_rest_collection(
-                'entity_route'
-            )
-            self.cache['main_routes'] = {
-                entity_route['entity_id']: entity_route
-                for entity_route in filter(
-                    lambda x: x['alternate'] is False,
-                    entity_routes
-                )
-            }
-
-        main_routes = self.cache['main_routes']
+        main_routes = self.reference.main_routes
 
         if entity_id not in main_routes:
             return None
 
-        entity_route_id = main_routes[entity_id]['id']
-
-        if 'last_operations_entity_route_id' not in self.cache:
-
-            operations = sorted(
-                self._get_from_rest_collection('operation'),
-                key=lambda x: x['nop']
-            )
-
-            self.cache['last_operations_entity_route_id'] = {}
-            for row in operations:
-                self.cache[
-                    'last_operations_entity_route_id'
-                ][row['entity_route_id']] = row
-
-        last_operations_entity_route_id = self.cache[
-            'last_operations_entity_route_id'
-        ]
-
-        try:
-            operation = last_operations_entity_route_id[entity_route_id]
-        except IndexError:
+        operation = self.reference.last_operations.get(
+            main_routes[entity_id]['id']
+        )
+        if operation is None:
             return None
 
         return self.get_phase_with_operation_id(operation['id'])
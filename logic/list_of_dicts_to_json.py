@@ -1,15 +1,119 @@
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from time import perf_counter, time_ns
 
+from tqdm import tqdm
 
-def list_of_dicts_to_json(data, path, folder):
-    print('Отправка {} записей в {}{}'.format(
+_SHARD_PREFIX = 'part-'
+_SHARD_SUFFIX = '.ndjson'
+_MANIFEST = 'manifest.json'
+
+
+def list_of_dicts_to_json(data, path, folder, mode='files', shard_size=None,
+                          workers=1):
+    started = perf_counter()
+    target_folder = path + folder
+    Path(target_folder).mkdir(parents=True, exist_ok=True)
+    if mode == 'ndjson':
+        written = _write_ndjson_shards(data, Path(target_folder), shard_size)
+    elif mode == 'files':
+        written = _write_files(data, target_folder, workers)
+    else:
+        raise ValueError(f'Неизвестный режим выгрузки в json: {mode}')
+    tqdm.write('Записано {} записей ({:.1f} МБ) в {}{} за {:.1f} с'.format(
         len(data),
+        written / 1024 / 1024,
         path,
-        folder
+        folder,
+        perf_counter() - started
     ))
-    target_folder = path + folder
-    Path(target_folder).mkdir(parents=True, exist_ok=True)
-    for row in data:
-        with open('{}{}.json'.format(target_folder, row['identity']), 'w') as output_file:
-            json.dump(row, output_file)
+
+
+def _write_file(file_path, row):
+    body = json.dumps(row).encode('utf8')
+    with open(file_path, 'wb') as output_file:
+        output_file.write(body)
+    return len(body)
+
+
+def _write_files(data, target_folder, workers):
+    file_paths = [
+        '{}{}.json'.format(target_folder, row['identity']) for row in data
+    ]
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(_write_file, file_paths, data))
+    return sum(map(_write_file, file_paths, data))
+
+
+def _read_manifest(target_folder):
+    manifest_path = target_folder / _MANIFEST
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as input_file:
+            return json.load(input_file)['shards']
+    except FileNotFoundError:
+        return []
+
+
+def read_ndjson_shards(target_folder):
+    # Записи последней завершенной выгрузки в режиме ndjson. Читаются
+    # только части из manifest.json, поэтому части выгрузки, которая
+    # еще пишется, не смешиваются с частями предыдущей.
+    target_folder = Path(target_folder)
+    for shard in _read_manifest(target_folder):
+        with open(target_folder / shard, 'r', encoding='utf-8') as input_file:
+            for line in input_file:
+                yield json.loads(line)
+
+
+def _write_ndjson_shards(data, target_folder, shard_size):
+    # Записи пишутся построчно в один или несколько файлов, размер
+    # каждого ограничен shard_size байт. Имена частей содержат номер
+    # выгрузки, поэтому части предыдущей выгрузки не перезаписываются.
+    # Список новых частей атомарно записывается в manifest.json последним,
+    # после чего удаляются все части, кроме новой и предыдущей выгрузок:
+    # читатель, который открыл прежний manifest.json, дочитает свои части.
+    generation = '{:x}'.format(time_ns())
+    previous = set(_read_manifest(target_folder))
+    shards = []
+    output_file = None
+    written = 0
+    total_written = 0
+    try:
+        for row in data:
+            line = (json.dumps(row) + '\n').encode('utf8')
+            if output_file is None or (
+                    shard_size and written and written + len(line) > shard_size
+            ):
+                if output_file is not None:
+                    output_file.close()
+                shard = '{}{}-{:05d}{}'.format(
+                    _SHARD_PREFIX, generation, len(shards), _SHARD_SUFFIX
+                )
+                shards.append(shard)
+                output_file = open(target_folder / shard, 'wb')
+                written = 0
+            output_file.write(line)
+            written += len(line)
+            total_written += len(line)
+    except BaseException:
+        for shard in shards:
+            (target_folder / shard).unlink(missing_ok=True)
+        raise
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+    manifest_path = target_folder / _MANIFEST
+    temp_path = target_folder / f'{_MANIFEST}.{generation}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as output_file:
+        json.dump({'shards': shards}, output_file)
+    os.replace(temp_path, manifest_path)
+
+    keep = previous.union(shards)
+    for stale in target_folder.glob(f'{_SHARD_PREFIX}*{_SHARD_SUFFIX}'):
+        if stale.name not in keep:
+            stale.unlink(missing_ok=True)
+    return total_written
@@ -0,0 +1,76 @@
+__all__ = [
+    'OPERATION_FLAGS',
+    'DEFAULT_EXCLUSION_RULES',
+    'OperationFlags',
+    'compile_exclusion_rules',
+]
+
+# Признаки операций по обозначению и номеру операции. Выгрузки
+# исключают операции с некоторыми из этих признаков.
+OPERATION_FLAGS = {
+    # в обозначении есть кириллическая 'с'
+    'marker_s': lambda identity, nop: 'с' in identity,
+    # в обозначении есть кириллическая 'н'
+    'marker_n': lambda identity, nop: 'н' in identity,
+    # обозначение оканчивается на 'Ц'
+    'suffix_ts': lambda identity, nop: identity[-1:] == 'Ц',
+    # обозначение оканчивается на 'MH' латиницей или 'МН' кириллицей
+    'suffix_mh': lambda identity, nop: identity[-2:] in ('MH', 'МН'),
+    # номер операции оканчивается на '_1'
+    'nop_suffix_1': lambda identity, nop: nop[-2:] == '_1',
+}
+
+_ALL_FLAGS = tuple(OPERATION_FLAGS)
+
+# Наборы признаков исключаемых операций для каждой выгрузки. В
+# конфигурации IA их можно переопределить ключом exclusion_rules.
+DEFAULT_EXCLUSION_RULES = {
+    'ca_phases': ('marker_s', 'marker_n'),
+    'ca_operations': _ALL_FLAGS,
+    'ca_daily_tasks': _ALL_FLAGS,
+    'daily_task_orders': _ALL_FLAGS,
+    'bfg_plan': ('marker_n',),
+    'phases_for_plan': ('marker_s', 'marker_n'),
+}
+
+
+def compile_exclusion_rules(default_rules, config_rules=None):
+    rules = dict(default_rules)
+    rules.update(config_rules or {})
+    compiled = {}
+    for name, flags in rules.items():
+        unknown = set(flags or ()) - OPERATION_FLAGS.keys()
+        if unknown:
+            raise ValueError(
+                f'Неизвестные признаки операций в правиле {name}: '
+                f'{", ".join(sorted(unknown))}'
+            )
+        compiled[name] = frozenset(flags or ())
+    return compiled
+
+
+class OperationFlags(object):
+    # Признаки вычисляются один раз для каждой операции и хранятся как
+    # множества id операций, у которых признак установлен.
+
+    def __init__(self, operations):
+        self._ids = {flag: set() for flag in OPERATION_FLAGS}
+        for operation in operations:
+            identity = operation['identity']
+            nop = operation['nop']
+            for flag, predicate in OPERATION_FLAGS.items():
+                if predicate(identity, nop):
+                    self._ids[flag].add(operation['id'])
+        self._excluded = {}
+
+    def has(self, flag, operation_id):
+        return operation_id in self._ids[flag]
+
+    def excluded(self, flags):
+        # id операций, у которых есть хотя бы один из признаков flags
+        flags = frozenset(flags)
+        if flags not in self._excluded:
+            self._excluded[flags] = frozenset().union(
+                *(self._ids[flag] for flag in flags)
+            )
+        return self._excluded[flags]
@@ -0,0 +1,36 @@
+__all__ = [
+    'OrderExpansion',
+]
+
+
+class OrderExpansion(object):
+    # Развертывание записей по заказам: каждая ДСЕ выгружается отдельно
+    # для каждого своего заказа с обозначением "{заказ}_{обозначение}".
+    # Обозначения ДСЕ с префиксом заказа строятся один раз и используются
+    # всеми выгрузками: ДСЕ, спецификациями, маршрутами и операциями.
+
+    def __init__(self, entity_orders):
+        self._entity_orders = entity_orders
+        self._orders = {}
+        self._entity_identities = {}
+
+    def orders(self, entity_identity):
+        orders = self._orders.get(entity_identity)
+        if orders is None:
+            orders = self._orders[entity_identity] = tuple(
+                self._entity_orders.get(entity_identity, ())
+            )
+        return orders
+
+    def entity_identity(self, order, entity_identity):
+        key = (order, entity_identity)
+        identity = self._entity_identities.get(key)
+        if identity is None:
+            identity = self._entity_identities[key] = \
+                f'{order}_{entity_identity}'
+        return identity
+
+    def expand(self, entity_identity):
+        # пары (заказ, обозначение ДСЕ с префиксом заказа)
+        for order in self.orders(entity_identity):
+            yield order, self.entity_identity(order, entity_identity)
@@ -0,0 +1,135 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Event
+from time import perf_counter
+
+from tqdm import tqdm
+
+__all__ = [
+    'run_queues',
+]
+
+
+def run_queues(ia, queues, publish, workers=1):
+    # queues -- упорядоченное соответствие "очередь -> метод выгрузки".
+    # Сначала один раз загружаются все нужные выгрузкам таблицы, затем
+    # выгрузки выполняются параллельно, а результат каждой публикуется
+    # в вызывающем потоке сразу по готовности и сразу освобождается.
+    # Итоговые строки по очередям выводятся в порядке очередей из
+    # конфигурации; собственные сообщения выгрузок при workers > 1
+    # могут перемежаться.
+    methods = list(dict.fromkeys(queues.values()))
+
+    started = perf_counter()
+    ia.prefetch(methods)
+    tqdm.write(f'Справочники загружены за {perf_counter() - started:.1f} с')
+
+    method_queues = {}
+    for queue, method in queues.items():
+        method_queues.setdefault(method, []).append(queue)
+
+    messages = {}
+    next_message = 0
+
+    def publish_records(method, records, duration):
+        messages[method] = []
+        for queue in method_queues[method]:
+            publish_started = perf_counter()
+            publish(queue, records)
+            messages[method].append(
+                f'Очередь {queue}: {len(records)} записей, '
+                f'выгрузка {duration:.1f} с, '
+                f'отправка {perf_counter() - publish_started:.1f} с'
+            )
+
+    def flush_messages():
+        nonlocal next_message
+        while next_message < len(methods) and \
+                methods[next_message] in messages:
+            for message in messages.pop(methods[next_message]):
+                tqdm.write(message)
+            next_message += 1
+
+    if workers <= 1:
+        # без параллельности выгрузки выполняются по очереди в этом
+        # потоке, и в памяти одновременно только записи одной из них
+        for method in _ordered(ia, methods, method_queues):
+            method_started = perf_counter()
+            records = getattr(ia, method)()
+            publish_records(method, records, perf_counter() - method_started)
+            del records
+            flush_messages()
+        return
+
+    # зависимые выгрузки ждут событие, а не future с записями, чтобы
+    # записи освобождались сразу после публикации
+    finished = {}
+    failed = set()
+    futures = {}
+    executor = ThreadPoolExecutor(
+        max_workers=workers,
+        thread_name_prefix='export'
+    )
+
+    def run(method, dependencies):
+        try:
+            for dependency in dependencies:
+                finished[dependency].wait()
+                if dependency in failed:
+                    raise RuntimeError(
+                        f'Выгрузка {dependency}, от которой зависит '
+                        f'{method}, завершилась с ошибкой'
+                    )
+            method_started = perf_counter()
+            return getattr(ia, method)(), perf_counter() - method_started
+        except BaseException:
+            failed.add(method)
+            raise
+        finally:
+            finished[method].set()
+
+    def submit(method):
+        # зависимости ставятся в пул раньше зависящих от них выгрузок,
+        # поэтому ожидание внутри run не может занять все потоки пула
+        if method in futures:
+            return
+        dependencies = [
+            dependency
+            for dependency in ia.export_dependencies.get(method, ())
+            if dependency in method_queues
+        ]
+        for dependency in dependencies:
+            submit(dependency)
+        finished[method] = Event()
+        futures[method] = executor.submit(run, method, dependencies)
+
+    try:
+        for method in methods:
+            submit(method)
+        method_futures = {future: method for method, future in futures.items()}
+        futures.clear()
+        for future in as_completed(list(method_futures)):
+            method = method_futures.pop(future)
+            records, duration = future.result()
+            del future
+            publish_records(method, records, duration)
+            del records
+            flush_messages()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _ordered(ia, methods, method_queues):
+    # методы в порядке очередей, зависимости -- раньше зависящих от них
+    ordered = []
+
+    def add(method):
+        if method in ordered:
+            return
+        for dependency in ia.export_dependencies.get(method, ()):
+            if dependency in method_queues:
+                add(dependency)
+        ordered.append(method)
+
+    for method in methods:
+        add(method)
+    return ordered
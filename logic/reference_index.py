@@ -0,0 +1,124 @@
+from collections import defaultdict
+from functools import cached_property
+
+from tqdm import tqdm
+
+from .bom import BomIndex
+from .operation_rules import OperationFlags
+
+__all__ = [
+    'ReferenceIndex',
+]
+
+
+def _by_id(rows, column='id'):
+    return {row[column]: row for row in rows}
+
+
+class ReferenceIndex(object):
+    # Справочники строятся один раз за сессию и разделяются всеми
+    # выгрузками. Строки таблиц не копируются, поэтому изменять
+    # полученные словари нельзя.
+
+    # таблицы, необходимые для построения каждого справочника
+    _requires = {
+        'entities': ('entity',),
+        'entity_routes': ('entity_route',),
+        'entity_route_phases': ('entity_route_phase',),
+        'departments': ('department',),
+        'equipment_classes': ('equipment_class',),
+        'operations': ('operation',),
+        'operations_by_nop': ('operation',),
+        'route_operations': ('operation',),
+        'last_operations': ('operation',),
+        'main_routes': ('entity_route',),
+        'phase_identity': ('operation', 'entity_route_phase'),
+        'operation_flags': ('operation',),
+        'bom': ('specification_item',),
+    }
+
+    def __init__(self, get_collection):
+        self._get_collection = get_collection
+
+    def warm(self, tables):
+        # Заранее строит все справочники, для которых загружены таблицы,
+        # чтобы параллельные выгрузки не строили их одновременно.
+        tables = set(tables)
+        for name, required in self._requires.items():
+            if tables.issuperset(required):
+                getattr(self, name)
+
+    @cached_property
+    def entities(self):
+        return _by_id(self._get_collection('entity'))
+
+    @cached_property
+    def entity_routes(self):
+        return _by_id(self._get_collection('entity_route'))
+
+    @cached_property
+    def entity_route_phases(self):
+        return _by_id(self._get_collection('entity_route_phase'))
+
+    @cached_property
+    def departments(self):
+        return _by_id(self._get_collection('department'))
+
+    @cached_property
+    def equipment_classes(self):
+        return _by_id(self._get_collection('equipment_class'))
+
+    @cached_property
+    def operations(self):
+        return _by_id(self._get_collection('operation'))
+
+    @cached_property
+    def operations_by_nop(self):
+        return sorted(
+            self._get_collection('operation'),
+            key=lambda k: k['nop']
+        )
+
+    @cached_property
+    def route_operations(self):
+        route_operations = defaultdict(list)
+        for row in self.operations_by_nop:
+            route_operations[row['entity_route_id']].append(row)
+        return dict(route_operations)
+
+    @cached_property
+    def last_operations(self):
+        return {
+            entity_route_id: operations[-1]
+            for entity_route_id, operations in self.route_operations.items()
+        }
+
+    @cached_property
+    def main_routes(self):
+        return {
+            entity_route['entity_id']: entity_route
+            for entity_route in self._get_collection('entity_route')
+            if entity_route['alternate'] is False
+        }
+
+    @cached_property
+    def bom(self):
+        return BomIndex(self._get_collection('specification_item'))
+
+    @cached_property
+    def operation_flags(self):
+        return OperationFlags(self._get_collection('operation'))
+
+    @cached_property
+    def phase_identity(self):
+        phase_identity = {}
+        for operation in self.operations_by_nop:
+            if operation['entity_route_phase_id'] is None:
+                if '(' not in operation['identity']:
+                    tqdm.write(f'Не найдена фаза для '
+                               f'операции {operation["identity"]}')
+                continue
+            phase_identity[operation['id']] = self.entity_route_phases[
+                operation['entity_route_phase_id']
+            ]['identity']
+        return phase_identity
@@ -0,0 +1,89 @@
+from collections import defaultdict
+
+from tqdm import tqdm
+
+__all__ = [
+    'WipSummary',
+]
+
+# подразделение для партий, операция которых не найдена
+_UNKNOWN_DEPARTMENT = '02904'
+
+
+class WipSummary(object):
+    # Итоги по партиям НЗП для выгрузок ca_wip, ca_zapasy и pg_wip,
+    # собранные за один проход по entity_batch. Фаза каждой партии
+    # определяется один раз, суммы копятся по ключам-кортежам.
+    # last_phase -- IAImportExport.get_entity_last_phase, фаза партий
+    # без операции.
+
+    def __init__(self, batches, reference, last_phase):
+        self._reference = reference
+        self._last_phase = last_phase
+        self._last_phases = {}
+        self._operation_departments = {}
+
+        # ca_wip: фаза -> количество, фаза -> подразделение
+        self.wip_totals = defaultdict(float)
+        self.wip_departments = {}
+        # ca_zapasy: (фаза, подразделение, ДСЕ) -> количество
+        self.stock_totals = defaultdict(float)
+        self.stock_redirected = []
+        # pg_wip: только партии без снимка и с известной фазой
+        self.pg_totals = defaultdict(float)
+        self.pg_departments = {}
+        self.pg_missing_routes = []
+
+        main_routes = reference.main_routes
+        phase_identity = reference.phase_identity
+        entities = reference.entities
+
+        for row in tqdm(batches, desc='Разбор партий НЗП'):
+            operation_id = row['operation_id']
+            if operation_id is None:
+                if row['operation_progress'] == 0:
+                    continue
+                if row['entity_id'] not in main_routes:
+                    continue
+                transition_identity = self._get_last_phase(row['entity_id'])
+            else:
+                transition_identity = phase_identity.get(operation_id)
+            amount = row['amount']
+            warehouse = row['identity'][-4:]
+
+            self.wip_totals[transition_identity] += amount
+            self.wip_departments[transition_identity] = warehouse
+
+            department = self._get_operation_department(operation_id)
+            if department is None:
+                department = _UNKNOWN_DEPARTMENT
+                self.stock_redirected.append(row['identity'])
+            self.stock_totals[(
+                transition_identity,
+                department,
+                entities[row['entity_id']]['identity']
+            )] += amount
+
+            if row['entity_batch_snapshot_id'] is not None:
+                continue
+            if transition_identity is None:
+                self.pg_missing_routes.append(row['entity_id'])
+                continue
+            self.pg_totals[transition_identity] += amount
+            self.pg_departments[transition_identity] = warehouse
+
+    def _get_last_phase(self, entity_id):
+        if entity_id not in self._last_phases:
+            self._last_phases[entity_id] = self._last_phase(entity_id)
+        return self._last_phases[entity_id]
+
+    def _get_operation_department(self, operation_id):
+        if operation_id not in self._operation_departments:
+            try:
+                department = self._reference.departments[
+                    self._reference.operations[operation_id]['department_id']
+                ]['identity']
+            except KeyError:
+                department = None
+            self._operation_departments[operation_id] = department
+        return self._operation_departments[operation_id]
@@ -10,10 +10,31 @@ __all__ = [
 import urllib3
 
 from config.config import read_config
-from logic.erp_fact_from_csv import get_erp_fact_from_csv
-from logic.erp_plan_from_csv import get_erp_plan_from_csv
 from logic.iaimportexport import IAImportExport
 from logic.list_of_dicts_to_json import list_of_dicts_to_json
+from logic.queue_scheduler import run_queues
+
+# папка из config['folders'] -> метод выгрузки
+EXPORTS = {
+    'spec': 'export_ca_spec',
+    # 'bom': 'export_ca_bom',
+    'ca_phases': 'export_ca_phases',
+    'equipment': 'export_ca_equipment',
+    'ca_zapasy': 'export_ca_zapasy',
+    # 'pg_wip': 'export_pg_wip',
+    'departments': 'export_departments',
+    # 'fact': 'export_erp_fact',
+    # 'erp_plan': 'export_erp_finish',
+    'entities': 'export_entities',
+    # 'phases': 'export_phases',
+    # 'phases_labor': 'export_phases_labor',
+    'ca_operations': 'export_ca_operations',
+    'routes': 'export_ca_routes',
+    'ca_wip': 'export_ca_wip',
+    # 'bfg_plan': 'export_bfg_finish',
+    # 'bfg_exec': 'export_bfg_launch',
+    'ca_daily_tasks': 'export_ca_daily_tasks',
+}
 
 
 def export_to_plgr():
@@ -24,6 +45,8 @@ def export_to_plgr():
                         default=join(getcwd(), 'config.yml'))
     parser.add_argument('-d', '--debug', required=False, action='store_true',
                         default=False)
+    parser.add_argument('-r', '--refresh-cache', required=False,
+                        action='store_true', default=False)
 
     args = parser.parse_args()
 
@@ -31,97 +54,24 @@ def export_to_plgr():
 
     config = read_config(args.config)
 
-    with IAImportExport.from_config(config['IA']) as ia:
+    if args.refresh_cache:
+        config['IA']['refresh_cache'] = True
 
-        list_of_dicts_to_json(
-            ia.export_ca_spec(),
-            config['default_path'],
-            config['folders']['spec']
-        )
-        list_of_dicts_to_json(
-            ia.export_ca_phases(),
-            config['default_path'],
-            config['folders']['ca_phases']
-        )
-        list_of_dicts_to_json(
-            ia.export_ca_equipment(),
-            config['default_path'],
-            config['folders']['equipment']
-        )
-        list_of_dicts_to_json(
-            ia.export_ca_zapasy(),
-            config['default_path'],
-            config['folders']['ca_zapasy']
-        )
-        # list_of_dicts_to_json(
-        #     ia.export_pg_wip(),
-        #     config['default_path'],
-        #     config['folders']['pg_wip']
-        # )
-        list_of_dicts_to_json(
-            ia.export_departments(),
-            config['default_path'],
-            config['folders']['departments']
-        )
-        # list_of_dicts_to_json(
-        #     get_erp_fact_from_csv('Fact_301.csv', ia),
-        #     config['default_path'],
-        #     config['folders']['fact']
-        # )
-        # list_of_dicts_to_json(
-        #     get_erp_plan_from_csv('plan.csv', ia),
-        #     config['default_path'],
-        #     config['folders']['erp_plan']
-        # )
-        list_of_dicts_to_json(
-            ia.export_entities(),
-            config['default_path'],
-            config['folders']['entities']
-        )
-        # list_of_dicts_to_json(
-        #     ia.export_phases(),
-        #     config['default_path'],
-        #     config['folders']['phases']
-        # )
-        # list_of_dicts_to_json(
-        #     ia.export_phases_labor(),
-        #     config['default_path'],
-        #     config['folders']['phases_labor']
-        # )
-        list_of_dicts_to_json(
-            ia.export_ca_operations(),
-            config['default_path'],
-            config['folders']['ca_operations']
-        )
-        list_of_dicts_to_json(
-            ia.export_ca_routes(),
-            config['default_path'],
-            config['folders']['routes']
-        )
-        list_of_dicts_to_json(
-            ia.export_ca_wip(),
-            config['default_path'],
-            config['folders']['ca_wip']
-        )
-        # list_of_dicts_to_json(
-        #     ia.export_bfg_plan(export_type=-1, qty_column='quantityPlanBFG'),
-        #     config['default_path'],
-        #     config['folders']['bfg_plan']
-        # )
-        # list_of_dicts_to_json(
-        #     ia.export_bfg_plan(export_type=-1, qty_column='quantityPlanERP'),
-        #     config['default_path'],
-        #     config['folders']['erp_plan']
-        # )
-        # list_of_dicts_to_json(
-        #     ia.export_bfg_plan(export_type=0, qty_column='quantityLaunch'),
-        #     config['default_path'],
-        #     config['folders']['bfg_exec']
-        # )
-        list_of_dicts_to_json(
-            ia.export_ca_daily_tasks(),
-            config['default_path'],
-            config['folders']['ca_daily_tasks']
+    shard_size = config.get('json_shard_size')
+
+    with IAImportExport.from_config(config['IA']) as ia:
+        run_queues(
+            ia,
+            EXPORTS,
+            lambda folder, data: list_of_dicts_to_json(
+                data,
+                config['default_path'],
+                config['folders'][folder],
+                config.get('json_mode') or 'files',
+                shard_size and shard_size * 1024 * 1024,
+                config.get('json_workers') or 1,
+            ),
+            config.get('export_workers') or 1,
         )
 
 
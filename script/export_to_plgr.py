@@ -12,6 +12,7 @@ from tqdm import tqdm
 
 from config.config import read_config
 from logic.iaimportexport import IAImportExport
+from logic.queue_scheduler import run_queues
 from send_to_rabbit.send_to_rabbit import Session
 
 
@@ -23,6 +24,8 @@ def export_to_plgr():
                         default=join(getcwd(), 'config_rabbit.yml'))
     parser.add_argument('-s', '--session', required=False)
     parser.add_argument('-p', '--period', required=False)
+    parser.add_argument('-r', '--refresh-cache', required=False,
+                        action='store_true', default=False)
     # parser.add_argument('-d', '--debug', required=False, action='store_true',
     #                     default=False)
 
@@ -38,6 +41,9 @@ def export_to_plgr():
     if args.period:
         config['daily_task_period'] = args.period
 
+    if args.refresh_cache:
+        config['IA']['refresh_cache'] = True
+
     if config['IA'].get('task_date') == 'today':
         config['IA']['task_date'] = str(datetime.date.today())
 
@@ -58,12 +64,27 @@ def export_to_plgr():
                         }
                     ]
                 )
-            for queue, method in config['queues'].items():
-                tqdm.write(f'Отправка сообщения в очередь {queue}')
-                session.send_dict_to_rabbit(
-                    queue,
-                    getattr(ia, method)(),
+            if (config.get('export_workers') or 1) > 1:
+                run_queues(
+                    ia,
+                    config['queues'],
+                    session.send_dict_to_rabbit,
+                    config['export_workers'],
                 )
+            else:
+                for queue, method in config['queues'].items():
+                    tqdm.write(f'Отправка сообщения в очередь {queue}')
+                    if config.get('stream'):
+                        session.send_stream(
+                            queue,
+                            ia.iter_export(method),
+                            config.get('stream_buffer') or 1000,
+                        )
+                    else:
+                        session.send_dict_to_rabbit(
+                            queue,
+                            getattr(ia, method)(),
+                        )
 
 
 if __name__ == '__main__':
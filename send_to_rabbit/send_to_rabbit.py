@@ -1,15 +1,22 @@
 import json
+import time
+from queue import Full, Queue
+from threading import Event, Thread
 
 import pika
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
 from sshtunnel import SSHTunnelForwarder, BaseSSHTunnelForwarderError, \
     open_tunnel
 from tqdm import tqdm
 
+_STREAM_END = object()
+
 
 class Session(object):
     def __init__(self, ssh_host, ssh_port, ssh_login, ssh_password,
                  remote_address, local_address,
-                 rabbit_user, rabbit_password):
+                 rabbit_user, rabbit_password,
+                 publish_window=None, publish_retries=3):
         if local_address:
             self.server = open_tunnel(
                 ssh_address_or_host=(ssh_host, ssh_port),
@@ -27,15 +34,22 @@ class Session(object):
         self.remote_address = remote_address
         self.rabbit_user = rabbit_user
         self.rabbit_password = rabbit_password
+        self.publish_window = publish_window
+        self.publish_retries = publish_retries
+
+        self._connection = None
+        self._channels = {}
+        self._declared_queues = set()
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self._close_connection()
         if self.server:
             self.server.close()
 
-    def send_dict_to_rabbit(self, queue, list_of_dicts):
+    def _make_url(self):
         if self.server:
             url = 'amqp://{}:{}@{}:{}'.format(
                             self.rabbit_user,
@@ -54,33 +68,150 @@ class Session(object):
                             # self.server.local_bind_address[0],
                             # self.server.local_bind_port
                         )
-        with pika.BlockingConnection(
-                pika.URLParameters(
-                    url=url,
-                )
-        ) as connection:
+        return url
+
+    def _connect(self):
+        self._close_connection()
+        self._connection = pika.BlockingConnection(
+            pika.URLParameters(
+                url=self._make_url(),
+            )
+        )
 
-            channel = connection.channel()
+    def _close_connection(self):
+        connection = self._connection
+        self._connection = None
+        self._channels = {}
+        self._declared_queues = set()
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except AMQPConnectionError:
+                pass
 
+    def _get_channel(self, queue):
+        if self._connection is None or not self._connection.is_open:
+            self._connect()
+        channel = self._channels.get(queue)
+        if channel is None or not channel.is_open:
+            channel = self._connection.channel()
+            if self.publish_window:
+                channel.tx_select()
+            self._channels[queue] = channel
+        if queue not in self._declared_queues:
             channel.queue_declare(queue=queue, durable=True)
+            self._declared_queues.add(queue)
+        return channel
 
+    def _publish(self, queue, body):
+        try:
+            self._get_channel(queue).basic_publish(
+                exchange='',
+                routing_key=queue,
+                body=body
+            )
+        except (AMQPConnectionError, AMQPChannelError) as error:
+            tqdm.write(f'Соединение с rabbit потеряно ({error!r}), '
+                       f'переподключение')
+            self._close_connection()
+            self._get_channel(queue).basic_publish(
+                exchange='',
+                routing_key=queue,
+                body=body
+            )
+
+    def _publish_window(self, queue, window):
+        # Окно сообщений подтверждается брокером одной транзакцией.
+        # При ошибке окно отправляется заново целиком, поэтому отдельные
+        # сообщения могут быть доставлены повторно, но не потеряются.
+        for attempt in range(self.publish_retries + 1):
+            try:
+                channel = self._get_channel(queue)
+                for body in window:
+                    channel.basic_publish(
+                        exchange='',
+                        routing_key=queue,
+                        body=body,
+                        properties=pika.BasicProperties(delivery_mode=2)
+                    )
+                channel.tx_commit()
+                return
+            except (AMQPConnectionError, AMQPChannelError) as error:
+                if attempt == self.publish_retries:
+                    raise
+                tqdm.write(f'Не удалось отправить {len(window)} сообщений '
+                           f'в очередь {queue} ({error!r}), повтор')
+                self._close_connection()
+                time.sleep(min(2 ** attempt, 30))
+
+    def send_dict_to_rabbit(self, queue, list_of_dicts):
+        if not self.publish_window:
             for dict_body in tqdm(
                     list_of_dicts, desc='Отправка сообщений в rabbit'
             ):
-                channel.basic_publish(
-                    exchange='',
-                    routing_key=queue,
-                    body=json.dumps(dict_body).encode('utf8')
-                )
-
-                # if '107203001001' not in dict_body['identity']:
-                #     continue
-                #
-                # with open(
-                #         f"export/{queue}/{dict_body['identity']}.json",
-                #         mode='w'
-                # ) as output:
-                #     json.dump(dict_body, output)
+                self._publish(queue, json.dumps(dict_body).encode('utf8'))
+            return
+
+        pbar = tqdm(
+            total=len(list_of_dicts) if hasattr(list_of_dicts, '__len__')
+            else None,
+            desc='Отправка сообщений в rabbit'
+        )
+        window = []
+        for dict_body in list_of_dicts:
+            window.append(json.dumps(dict_body).encode('utf8'))
+            if len(window) >= self.publish_window:
+                self._publish_window(queue, window)
+                pbar.update(len(window))
+                window = []
+        if window:
+            self._publish_window(queue, window)
+            pbar.update(len(window))
+        pbar.close()
+
+    def send_stream(self, queue, records, buffer_size=1000):
+        # Записи формируются в отдельном потоке и передаются через
+        # ограниченную очередь, поэтому отправка начинается сразу, а в
+        # памяти одновременно находится не больше buffer_size записей.
+        # Соединение pika не потокобезопасно, публикация остается в
+        # вызывающем потоке.
+        buffer = Queue(maxsize=buffer_size)
+        cancelled = Event()
+
+        def put(item):
+            while not cancelled.is_set():
+                try:
+                    buffer.put(item, timeout=0.5)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for record in records:
+                    if not put((record, None)):
+                        return
+                put((_STREAM_END, None))
+            except BaseException as error:
+                put((_STREAM_END, error))
+
+        def consume():
+            while True:
+                record, error = buffer.get()
+                if record is _STREAM_END:
+                    if error is not None:
+                        raise error
+                    return
+                yield record
+
+        producer = Thread(target=produce, name=f'export-{queue}', daemon=True)
+        producer.start()
+        try:
+            self.send_dict_to_rabbit(queue, consume())
+        finally:
+            cancelled.set()
+            producer.join()
 
     @classmethod
     def from_config(cls, config):
@@ -94,6 +225,8 @@ class Session(object):
                 tuple(config['local_address']),
                 config['rabbit_user'],
                 config['rabbit_password'],
+                config.get('publish_window'),
+                config.get('publish_retries', 3),
             )
         else:
             return cls(
@@ -105,4 +238,6 @@ class Session(object):
                 None,
                 config['rabbit_user'],
                 config['rabbit_password'],
+                config.get('publish_window'),
+                config.get('publish_retries', 3),
             )
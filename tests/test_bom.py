@@ -0,0 +1,80 @@
+import pytest
+
+from logic.bom import BomCycleError, BomIndex
+
+
+def _spec(*edges):
+    return [
+        {'parent_id': parent, 'child_id': child, 'amount': amount}
+        for parent, child, amount in edges
+    ]
+
+
+def test_multilevel_totals():
+    bom = BomIndex(_spec((1, 2, 2), (2, 3, 3), (1, 4, 1), (1, 2, 1)))
+    assert bom.roots == [1]
+    assert bom.totals(1) == {2: 3, 3: 9, 4: 1}
+    assert bom.totals(2) == {3: 3}
+    assert bom.totals(3) == {}
+
+
+def test_diamond_is_counted_through_both_branches():
+    # 1 -> 2 -> 4 и 1 -> 3 -> 4
+    bom = BomIndex(_spec((1, 2, 2), (1, 3, 3), (2, 4, 5), (3, 4, 7),
+                         (4, 5, 1)))
+    assert bom.totals(1) == {2: 2, 3: 3, 4: 31, 5: 31}
+    assert bom.cycles() == []
+
+
+def test_cycle_is_reported_and_reachable_assemblies_skipped():
+    bom = BomIndex(_spec((1, 2, 1), (2, 3, 1), (3, 2, 1), (4, 5, 1)))
+    assert bom.roots == [1, 4]
+    assert bom.cycles() == [[2, 3, 2]]
+    for entity_id in (1, 2, 3):
+        with pytest.raises(BomCycleError) as error:
+            bom.totals(entity_id)
+        assert error.value.cycle == [2, 3, 2]
+    assert bom.totals(4) == {5: 1}
+
+
+def test_self_loop():
+    bom = BomIndex(_spec((1, 1, 1), (2, 1, 1), (2, 3, 4)))
+    assert bom.cycles() == [[1, 1]]
+    with pytest.raises(BomCycleError):
+        bom.totals(2)
+    assert bom.totals(3) == {}
+
+
+def test_deep_chain():
+    depth = 20000
+    bom = BomIndex(_spec(*((i, i + 1, 1) for i in range(depth))))
+    totals = bom.totals(0)
+    assert len(totals) == depth
+    assert set(totals.values()) == {1}
+
+
+def test_shared_subassembly_is_exploded_once():
+    # 10 -> 20 и 11 -> 20, сборка 20 общая
+    bom = BomIndex(_spec((10, 20, 2), (11, 20, 3), (20, 30, 4), (30, 40, 5)))
+    explode = bom._explode
+    exploded = []
+
+    def counting_explode(entity_id):
+        exploded.append(entity_id)
+        return explode(entity_id)
+
+    bom._explode = counting_explode
+    assert bom.totals(10) == {20: 2, 30: 8, 40: 40}
+    assert bom.totals(11) == {20: 3, 30: 12, 40: 60}
+    assert exploded.count(20) == 1
+
+
+@pytest.mark.parametrize('cache_size', [0, 2, 5, 1000])
+def test_bounded_cache_gives_same_totals(cache_size):
+    edges = ((1, 2, 2), (1, 3, 3), (2, 4, 5), (3, 4, 7), (4, 5, 1),
+             (6, 4, 2), (6, 2, 1), (5, 7, 3))
+    expected = BomIndex(_spec(*edges)).totals
+    bom = BomIndex(_spec(*edges), cache_size=cache_size)
+    for entity_id in (1, 6, 4, 2, 1, 6):
+        assert bom.totals(entity_id) == expected(entity_id)
+    assert bom._cached_items <= cache_size
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from utils.collection_cache import CollectionCache, merge_by_id
+
+
+def _cache(tmp_path, **kwargs):
+    return CollectionCache(
+        tmp_path, 'https://ia.example/', {'entity': 60}, **kwargs
+    )
+
+
+def test_fresh_and_stale_entries(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store('entity', [{'id': 1}], fields=None)
+    entry = cache.load_entry('entity')
+    assert entry['rows'] == [{'id': 1}]
+    assert cache.is_fresh('entity', entry)
+
+    cache.store('entity', [{'id': 1}], created=time.time() - 120)
+    assert not cache.is_fresh('entity', cache.load_entry('entity'))
+    assert not cache.is_fresh('entity', None)
+
+
+def test_entry_without_requested_fields_is_ignored(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store('entity', [{'id': 1}], fields=('id',))
+    assert cache.load_entry('entity', ('id',)) is not None
+    assert cache.load_entry('entity', ('id', 'identity')) is None
+
+
+def test_sync_requires_timestamp_column_or_append_only(tmp_path):
+    with pytest.raises(ValueError):
+        _cache(tmp_path, sync={'entity_batch': {}})
+    with pytest.raises(ValueError):
+        _cache(tmp_path, sync={'entity_batch': None})
+    _cache(tmp_path, sync={'entity_batch': {'timestamp_column': 'updated'}})
+    _cache(tmp_path, sync={'operation': {'append_only': True}})
+
+
+def test_merge_by_id():
+    rows = [{'id': 1, 'v': 1}, {'id': 3, 'v': 3}]
+    assert merge_by_id(rows, [{'id': 2, 'v': 2}, {'id': 3, 'v': 4}]) == [
+        {'id': 1, 'v': 1}, {'id': 2, 'v': 2}, {'id': 3, 'v': 4},
+    ]
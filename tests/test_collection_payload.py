@@ -0,0 +1,53 @@
+from utils.collection_payload import collection_payload_to_lists, \
+    merge_collection_payload
+
+
+def test_link_tables_are_merged_by_natural_key():
+    first = {
+        'meta': {'count': 3},
+        'simulation_equipment': [{'id': 1}, {'id': 2}],
+        'simulation_operation_task_equipment': [
+            {'simulation_operation_task_id': 10,
+             'simulation_equipment_id': 1},
+            {'simulation_operation_task_id': 11,
+             'simulation_equipment_id': 2},
+        ],
+        'simulation_order_entity_batch': [
+            {'id': 5, 'simulation_entity_batch_id': 7, 'order_id': 1},
+        ],
+    }
+    second = {
+        'meta': {'count': 3},
+        'simulation_equipment': [{'id': 2}, {'id': 3}],
+        'simulation_operation_task_equipment': [
+            {'simulation_operation_task_id': 11,
+             'simulation_equipment_id': 2},
+            {'simulation_operation_task_id': 12,
+             'simulation_equipment_id': 3},
+        ],
+        'simulation_order_entity_batch': [
+            {'id': 5, 'simulation_entity_batch_id': 7, 'order_id': 2},
+        ],
+    }
+    merged = {}
+    merge_collection_payload(merged, first)
+    merge_collection_payload(merged, second)
+    result = collection_payload_to_lists(merged)
+
+    assert 'meta' not in result
+    assert [row['id'] for row in result['simulation_equipment']] == [1, 2, 3]
+    assert [
+        row['simulation_operation_task_id']
+        for row in result['simulation_operation_task_equipment']
+    ] == [10, 11, 12]
+    # одинаковый id, но разные заказы -- обе строки сохраняются
+    assert [
+        row['order_id'] for row in result['simulation_order_entity_batch']
+    ] == [1, 2]
+
+
+def test_rows_without_id_are_deduplicated_by_content():
+    merged = {}
+    merge_collection_payload(merged, {'link': [{'a': 1}, {'a': 2}]})
+    merge_collection_payload(merged, {'link': [{'a': 2}]})
+    assert collection_payload_to_lists(merged) == {'link': [{'a': 1}, {'a': 2}]}
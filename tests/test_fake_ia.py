@@ -0,0 +1,45 @@
+import pytest
+
+from benchmark.dataset import generate_dataset
+from benchmark.fake_ia import FakeIAServer
+
+_TYPE_FILTER = (
+    '{simulation_operation_task_equipment.simulation_operation_task.type '
+    'in ["0"] }'
+)
+
+
+@pytest.fixture(scope='module')
+def ia():
+    server = FakeIAServer(generate_dataset(
+        0, entities=50, batches=100, tasks=200, orders=10
+    ))
+    yield server
+    server._server.server_close()
+
+
+def test_paging_and_id_filter(ia):
+    everything = ia.collection('entity', {})['entity']
+    page = ia.collection('entity', {'start': ['10'], 'stop': ['20']})
+    assert page['meta']['count'] == len(everything)
+    assert page['entity'] == everything[10:20]
+    newer = ia.collection('entity', {'filter': ['{ id gt 40 }']})
+    assert [row['id'] for row in newer['entity']] == [
+        row['id'] for row in everything if row['id'] > 40
+    ]
+
+
+def test_task_type_filter(ia):
+    payload = ia.collection('simulation_equipment', {
+        'filter': [f'{_TYPE_FILTER} and {{simulation_session_id eq 1 }}']
+    })
+    tasks = payload['simulation_operation_task']
+    assert tasks and {str(task['type']) for task in tasks} == {'0'}
+    task_ids = {task['id'] for task in tasks}
+    assert {
+        link['simulation_operation_task_id']
+        for link in payload['simulation_operation_task_equipment']
+    } == task_ids
+
+    unfiltered = ia.collection('simulation_equipment', {})
+    assert len(unfiltered['simulation_operation_task']) > len(tasks)
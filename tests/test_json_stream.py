@@ -0,0 +1,52 @@
+import json
+from json import JSONDecodeError
+
+import pytest
+
+from utils.json_stream import JSONCollectionStream
+
+
+def _chunked(text, size):
+    data = text.encode('utf8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+PAYLOADS = [
+    {'tbl': [12.5, 2]},
+    {'tbl': [1e+20, 2]},
+    {'tbl': [3.14e-05]},
+    {'tbl': [-0.5, -17, 0, 1e-7, 123456789012345678]},
+    {'tbl': [True, False, None, 'строка', {'id': 1, 'amount': 2.75}]},
+    {'meta': {'count': 3, 'total': 3.5}, 'tbl': [{'id': 1}],
+     'other': [{'id': 2, 'value': 10.25}]},
+    {'tbl': []},
+]
+
+
+@pytest.mark.parametrize('payload', PAYLOADS)
+def test_every_chunk_size(payload):
+    text = json.dumps(payload, ensure_ascii=False)
+    for size in range(1, len(text.encode('utf8')) + 1):
+        stream = JSONCollectionStream(_chunked(text, size), 'tbl')
+        assert stream.to_dict() == payload, size
+
+
+def test_rows_are_streamed_and_side_tables_kept():
+    text = json.dumps({'tbl': [{'id': 1}, {'id': 2}], 'meta': {'x': 1.5}})
+    stream = JSONCollectionStream(_chunked(text, 3), 'tbl')
+    assert [row['id'] for row in stream] == [1, 2]
+    assert stream.found
+    assert stream.meta == {'x': 1.5}
+
+
+def test_missing_table():
+    stream = JSONCollectionStream([b'{"meta": {}}'], 'tbl')
+    assert stream.to_dict() == {'meta': {}}
+    assert not stream.found
+
+
+@pytest.mark.parametrize('text', ['{"tbl": [12.', '{"tbl": [1 2]}', '{"tbl"'])
+def test_malformed(text):
+    for size in range(1, len(text) + 1):
+        with pytest.raises(JSONDecodeError):
+            JSONCollectionStream(_chunked(text, size), 'tbl').to_dict()
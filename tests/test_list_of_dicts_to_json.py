@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+pytest.importorskip('tqdm')
+
+from logic.list_of_dicts_to_json import list_of_dicts_to_json, \
+    read_ndjson_shards
+
+
+def _rows(count, tag):
+    return [{'identity': f'{tag}{i}', 'value': i} for i in range(count)]
+
+
+def test_ndjson_shards_are_size_capped(tmp_path):
+    rows = _rows(50, 'a')
+    list_of_dicts_to_json(rows, f'{tmp_path}/', 'out/', 'ndjson', 200)
+    folder = tmp_path / 'out'
+    with open(folder / 'manifest.json') as input_file:
+        shards = json.load(input_file)['shards']
+    assert len(shards) > 1
+    for shard in shards:
+        assert (folder / shard).stat().st_size <= 200
+    assert list(read_ndjson_shards(folder)) == rows
+
+
+def test_readers_follow_the_manifest(tmp_path):
+    folder = tmp_path / 'out'
+    list_of_dicts_to_json(_rows(30, 'a'), f'{tmp_path}/', 'out/', 'ndjson',
+                          100)
+    first = set(path.name for path in folder.glob('part-*'))
+    list_of_dicts_to_json(_rows(5, 'b'), f'{tmp_path}/', 'out/', 'ndjson',
+                          100)
+    # части предыдущей выгрузки остаются до следующей
+    assert first <= set(path.name for path in folder.glob('part-*'))
+    assert list(read_ndjson_shards(folder)) == _rows(5, 'b')
+
+    list_of_dicts_to_json(_rows(3, 'c'), f'{tmp_path}/', 'out/', 'ndjson',
+                          100)
+    assert not first & set(path.name for path in folder.glob('part-*'))
+    assert list(read_ndjson_shards(folder)) == _rows(3, 'c')
+
+
+def test_files_mode(tmp_path):
+    rows = _rows(10, 'x')
+    list_of_dicts_to_json(rows, f'{tmp_path}/', 'out/', workers=4)
+    for row in rows:
+        with open(tmp_path / 'out' / f"{row['identity']}.json") as input_file:
+            assert json.load(input_file) == row
@@ -0,0 +1,44 @@
+import pytest
+
+from logic.operation_rules import DEFAULT_EXCLUSION_RULES, OPERATION_FLAGS, \
+    OperationFlags, compile_exclusion_rules
+
+OPERATIONS = [
+    {'id': 1, 'identity': 'ОП-1н', 'nop': '005'},
+    {'id': 2, 'identity': 'ОП-2с', 'nop': '010'},
+    {'id': 3, 'identity': 'ОП-3', 'nop': '015_1'},
+    {'id': 4, 'identity': 'ОП-4Ц', 'nop': '020'},
+    {'id': 5, 'identity': 'ОП-5MH', 'nop': '025'},
+    {'id': 6, 'identity': 'ОП-6МН', 'nop': '030'},
+    {'id': 7, 'identity': 'ОП-7', 'nop': '035'},
+]
+
+
+def test_defaults_and_overrides():
+    rules = compile_exclusion_rules(
+        DEFAULT_EXCLUSION_RULES,
+        {'ca_phases': ['marker_n'], 'custom': None}
+    )
+    assert rules['ca_phases'] == frozenset({'marker_n'})
+    assert rules['custom'] == frozenset()
+    assert rules['ca_operations'] == frozenset(OPERATION_FLAGS)
+    assert rules['bfg_plan'] == frozenset({'marker_n'})
+
+
+def test_unknown_flag_is_rejected():
+    with pytest.raises(ValueError, match='marker_x'):
+        compile_exclusion_rules(DEFAULT_EXCLUSION_RULES,
+                                {'ca_phases': ['marker_x']})
+
+
+def test_operation_flags():
+    flags = OperationFlags(OPERATIONS)
+    # кириллические 'с' и 'н' в обозначении
+    assert flags.excluded({'marker_s'}) == {2}
+    assert flags.excluded({'marker_n'}) == {1}
+    assert flags.excluded({'suffix_ts'}) == {4}
+    assert flags.excluded({'suffix_mh'}) == {5, 6}
+    assert flags.excluded({'nop_suffix_1'}) == {3}
+    assert flags.excluded(OPERATION_FLAGS) == {1, 2, 3, 4, 5, 6}
+    assert flags.excluded(()) == frozenset()
+    assert flags.has('suffix_ts', 4) and not flags.has('suffix_ts', 7)
@@ -0,0 +1,68 @@
+import gc
+import weakref
+
+import pytest
+
+pytest.importorskip('tqdm')
+
+from logic.queue_scheduler import run_queues
+
+
+class _Records(list):
+    pass
+
+
+class _IA(object):
+    export_dependencies = {'export_b': ('export_a',)}
+
+    def __init__(self):
+        self.calls = []
+        self.produced = []
+
+    def prefetch(self, methods):
+        pass
+
+    def _export(self, name, count):
+        self.calls.append(name)
+        records = _Records(range(count))
+        self.produced.append(weakref.ref(records))
+        return records
+
+    def export_a(self):
+        return self._export('export_a', 5)
+
+    def export_b(self):
+        return self._export('export_b', 3)
+
+    def export_c(self):
+        return self._export('export_c', 1)
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_records_are_released_after_publishing(workers):
+    ia = _IA()
+    published = []
+
+    def publish(queue, records):
+        gc.collect()
+        alive = sum(1 for ref in ia.produced if ref() is not None)
+        published.append((queue, len(records), alive))
+
+    run_queues(ia, {'qb': 'export_b', 'qa': 'export_a', 'qc': 'export_c'},
+               publish, workers)
+    assert sorted(queue for queue, _, _ in published) == ['qa', 'qb', 'qc']
+    assert ia.calls.index('export_a') < ia.calls.index('export_b')
+    if workers == 1:
+        assert [alive for _, _, alive in published] == [1, 1, 1]
+    gc.collect()
+    assert all(ref() is None for ref in ia.produced)
+
+
+def test_dependency_failure_is_raised():
+    class FailingIA(_IA):
+        def export_a(self):
+            raise ValueError('export_a')
+
+    with pytest.raises(ValueError):
+        run_queues(FailingIA(), {'qb': 'export_b', 'qa': 'export_a'},
+                   lambda queue, records: None, 2)
@@ -0,0 +1,73 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from utils.task_clock import TaskClock
+
+
+def test_legacy_parsing_subtracts_three_hours():
+    clock = TaskClock()
+    assert clock.parse('2026-10-17T10:30:00+03:00') == \
+        datetime(2026, 10, 17, 7, 30)
+
+
+def test_timezone_conversion():
+    clock = TaskClock(timezone(timedelta(hours=5)))
+    assert clock.parse('2026-10-17T10:30:00+03:00') == \
+        datetime(2026, 10, 17, 12, 30)
+    assert clock.parse('2026-10-17T10:30:00') == \
+        datetime(2026, 10, 17, 10, 30)
+
+
+def test_default_shift_bucketing():
+    clock = TaskClock(timezone.utc)
+    day = date(2026, 10, 17).toordinal()
+    assert clock.day_shift('2026-10-17T00:00:00+00:00') == (day, 0)
+    assert clock.day_shift('2026-10-17T11:59:00+00:00') == (day, 0)
+    assert clock.day_shift('2026-10-17T12:00:00+00:00') == (day, 1)
+    assert clock.day_shift('2026-10-17T23:59:00+00:00') == (day, 1)
+    assert clock.shift_label(0) == '07:00:00'
+    assert clock.day_label(day) == '2026-10-17'
+
+
+def test_task_before_first_shift_goes_to_previous_day():
+    clock = TaskClock(timezone.utc, [('19:00', 'night'), ('07:00', 'day')])
+    day = date(2026, 10, 17).toordinal()
+    # смены сортируются по началу
+    assert clock.day_shift('2026-10-17T08:00:00+00:00') == (day, 0)
+    assert clock.shift_label(0) == 'day'
+    assert clock.day_shift('2026-10-17T20:00:00+00:00') == (day, 1)
+    assert clock.day_shift('2026-10-17T03:00:00+00:00') == (day - 1, 1)
+
+
+def test_integer_shift_start_is_minutes():
+    clock = TaskClock(timezone.utc, [(0, 'a'), (720, 'b')])
+    day = date(2026, 10, 17).toordinal()
+    assert clock.day_shift('2026-10-17T12:00:00+00:00') == (day, 1)
+
+
+@pytest.mark.parametrize('shifts', [
+    [('25:00', 'a')],
+    [('07:75', 'a')],
+    [('07:00', 'a'), ('07:00', 'b')],
+    [('07:00',)],
+    [('утро', 'a')],
+])
+def test_invalid_shifts(shifts):
+    with pytest.raises(ValueError):
+        TaskClock(None, shifts)
+
+
+def test_today_uses_configured_timezone():
+    ahead = timezone(timedelta(hours=14))
+    behind = timezone(timedelta(hours=-12))
+    assert TaskClock(ahead).today() == datetime.now(ahead).date().toordinal()
+    assert TaskClock(behind).today() == \
+        datetime.now(behind).date().toordinal()
+    assert TaskClock().today() == date.today().toordinal()
+
+
+def test_from_config():
+    clock = TaskClock.from_config({'timezone': 3, 'shifts': [['08:00', 'x']]})
+    assert clock.tz == timezone(timedelta(hours=3))
+    assert clock.shift_label(0) == 'x'
@@ -0,0 +1,84 @@
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.task_store import TaskStore
+
+
+def _row(identity, date_begin, quantity=1):
+    return {
+        'identity': identity,
+        'dateBegin': date_begin,
+        'quantityPlan': quantity,
+        'equipments': [{'identity': 'eq'}],
+    }
+
+
+def test_save_writes_one_file_per_date(tmp_path):
+    with TaskStore(tmp_path / 'store') as store:
+        store.save([
+            _row('a', '2026-10-16'),
+            _row('b', '2026-10-17'),
+            _row('c', '2026-10-17'),
+        ])
+    files = sorted(path.name for path in (tmp_path / 'store').iterdir())
+    assert files == ['2026-10-16.json', '2026-10-17.json']
+    with open(tmp_path / 'store' / '2026-10-17.json') as input_file:
+        assert set(json.load(input_file)) == {'b', 'c'}
+
+
+def test_prune_and_disappeared(tmp_path):
+    with TaskStore(tmp_path) as store:
+        store.save([
+            _row('old', '2026-10-16'),
+            _row('kept', '2026-10-17'),
+            _row('gone', '2026-10-18'),
+        ])
+
+    with TaskStore(tmp_path) as store:
+        store.prune('2026-10-17')
+        assert not (tmp_path / '2026-10-16.json').exists()
+        current = {'kept': _row('kept', '2026-10-17', 5)}
+        assert [row['identity'] for row in store.disappeared(current)] \
+            == ['gone']
+        store.save(current.values())
+
+    assert not (tmp_path / '2026-10-18.json').exists()
+    with TaskStore(tmp_path) as store:
+        assert store.disappeared({}) == [_row('kept', '2026-10-17', 5)]
+
+
+def test_legacy_csv_is_imported_once(tmp_path):
+    legacy = tmp_path / 'tasks.csv.bak'
+    with open(legacy, 'w', newline='') as output_file:
+        writer = csv.DictWriter(
+            output_file, ['identity', 'dateBegin', 'equipments']
+        )
+        writer.writeheader()
+        writer.writerow({
+            'identity': 'a', 'dateBegin': '2026-10-17',
+            'equipments': "[{'identity': 'eq'}]",
+        })
+    with TaskStore(tmp_path / 'store', legacy) as store:
+        [row] = store.disappeared({})
+        assert row['equipments'] == [{'identity': 'eq'}]
+        store.save([row])
+    assert not legacy.exists()
+    assert (tmp_path / 'tasks.csv.bak.imported').exists()
+
+
+def test_concurrent_owners_of_one_path(tmp_path):
+    # каждый поток добавляет свою запись к уже сохраненным; без общей
+    # блокировки пути записи других потоков терялись бы
+    def add(identity):
+        with TaskStore(tmp_path) as store:
+            rows = {row['identity']: row for row in store.disappeared({})}
+            rows[identity] = _row(identity, '2026-10-17')
+            store.save(rows.values())
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(add, [f'task{i}' for i in range(64)]))
+
+    with TaskStore(tmp_path) as store:
+        assert len(store.disappeared({})) == 64
+    assert [path.name for path in tmp_path.iterdir()] == ['2026-10-17.json']
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import pickle
+import time
+import zlib
+from logging import getLogger
+from pathlib import Path
+
+__all__ = [
+    'CollectionCache',
+    'merge_by_id',
+    'fields_cover',
+    'merge_fields',
+]
+
+# Справочники IA меняются не чаще раза в сутки, поэтому по умолчанию
+# на диске хранятся только они. НЗП и прочие таблицы кэшируются только
+# при явном указании срока жизни в конфигурации.
+DEFAULT_TABLES_TTL = {
+    'entity': 24 * 60 * 60,
+    'operation': 24 * 60 * 60,
+    'entity_route': 24 * 60 * 60,
+    'entity_route_phase': 24 * 60 * 60,
+    'department': 24 * 60 * 60,
+}
+
+_SUFFIX = '.bin'
+
+# При инкрементальной синхронизации по дате изменения запрашиваем строки
+# с небольшим перекрытием, чтобы не потерять изменения из-за расхождения
+# часов между клиентом и сервером IA.
+SYNC_OVERLAP = 5 * 60
+
+
+class CollectionCache(object):
+    # sync -- таблицы с инкрементальной синхронизацией: таблица -> {
+    # timestamp_column, reconcile, append_only }. Без timestamp_column
+    # запрашиваются только строки с id больше уже полученных, и изменения
+    # существующих строк (например, количества в entity_batch) видны лишь
+    # после полной сверки раз в reconcile секунд. Поэтому для таких таблиц
+    # нужно явно указать append_only: true, иначе настройка отклоняется.
+
+    def __init__(self, path, base_url, tables_ttl, default_ttl=0,
+                 max_size=None, refresh=False, sync=None, logger=None):
+        self.root = Path(path)
+        self.path = self.root / hashlib.sha1(
+            base_url.encode('utf8')
+        ).hexdigest()[:16]
+        self.tables_ttl = tables_ttl
+        self.default_ttl = default_ttl
+        self.max_size = max_size
+        self.refresh = refresh
+        self.sync = sync or {}
+        self._logger = logger or getLogger(__name__)
+        for table, sync_config in self.sync.items():
+            sync_config = sync_config or {}
+            if not sync_config.get('timestamp_column') and \
+                    not sync_config.get('append_only'):
+                raise ValueError(
+                    f'Для синхронизации таблицы {table} нужен '
+                    f'timestamp_column или append_only: true'
+                )
+
+    def ttl(self, table):
+        return self.tables_ttl.get(table, self.default_ttl) or 0
+
+    def sync_config(self, table):
+        if table not in self.sync:
+            return None
+        return self.sync[table] or {}
+
+    def _is_cached(self, table):
+        return bool(self.ttl(table)) or table in self.sync
+
+    def _table_path(self, table):
+        return self.path / f'{table}{_SUFFIX}'
+
+    def load_entry(self, table, fields=None):
+        if self.refresh or not self._is_cached(table):
+            return None
+        table_path = self._table_path(table)
+        try:
+            with open(table_path, 'rb') as input_file:
+                entry = pickle.loads(zlib.decompress(input_file.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            self._logger.warning(
+                'Поврежден файл кэша {}, он будет удален'.format(table_path)
+            )
+            table_path.unlink(missing_ok=True)
+            return None
+        # время последнего обращения нужно для вытеснения старых таблиц
+        os.utime(table_path)
+        if not fields_cover(entry.get('fields'), fields):
+            self._logger.debug(
+                'В кэше таблицы {} нет нужных полей'.format(table)
+            )
+            return None
+        return entry
+
+    def is_fresh(self, table, entry):
+        if entry is None or not self.ttl(table):
+            return False
+        if time.time() - entry['created'] > self.ttl(table):
+            self._logger.debug('Кэш таблицы {} устарел'.format(table))
+            return False
+        return True
+
+    def store(self, table, rows, **meta):
+        if not self._is_cached(table):
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        entry = dict(meta, created=meta.get('created', time.time()), rows=rows)
+        table_path = self._table_path(table)
+        temp_path = table_path.with_suffix(f'{_SUFFIX}.{os.getpid()}.tmp')
+        with open(temp_path, 'wb') as output_file:
+            output_file.write(zlib.compress(
+                pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL),
+                1
+            ))
+        os.replace(temp_path, table_path)
+        self._evict()
+
+    def _evict(self):
+        if not self.max_size:
+            return
+        files = []
+        for item in self.root.glob(f'*/*{_SUFFIX}'):
+            stat = item.stat()
+            files.append((stat.st_mtime, stat.st_size, item))
+        files.sort()
+        total_size = sum(size for _, size, _ in files)
+        for _, size, item in files:
+            if total_size <= self.max_size:
+                break
+            self._logger.debug('Из кэша вытеснен файл {}'.format(item))
+            item.unlink(missing_ok=True)
+            total_size -= size
+
+    @classmethod
+    def from_config(cls, config):
+        cache_config = config.get('cache')
+        if not cache_config:
+            return None
+        if cache_config is True:
+            cache_config = {}
+        max_size = cache_config.get('max_size')
+        return cls(
+            cache_config.get('path') or '.ia_cache',
+            config['url'],
+            cache_config.get('tables') or DEFAULT_TABLES_TTL,
+            cache_config.get('ttl') or 0,
+            max_size and max_size * 1024 * 1024,
+            bool(config.get('refresh_cache')),
+            cache_config.get('sync'),
+        )
+
+
+def merge_by_id(rows, changed_rows):
+    if not changed_rows:
+        return rows
+    merged = {row['id']: row for row in rows}
+    for row in changed_rows:
+        merged[row['id']] = row
+    return [merged[row_id] for row_id in sorted(merged)]
+
+
+def fields_cover(available, requested):
+    # None означает строки со всеми полями
+    if available is None:
+        return True
+    if requested is None:
+        return False
+    return set(requested).issubset(available)
+
+
+def merge_fields(available, requested):
+    if available is None or requested is None:
+        return None
+    return tuple(dict.fromkeys((*available, *requested)))
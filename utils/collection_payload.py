@@ -0,0 +1,61 @@
+import json
+
+__all__ = [
+    'NATURAL_KEYS',
+    'merge_collection_payload',
+    'collection_payload_to_lists',
+    'project_rows',
+]
+
+
+# Таблицы связей, строки которых однозначно определяются не id, а парой
+# ссылок (в сменном задании они и индексируются по этим ссылкам).
+NATURAL_KEYS = {
+    'simulation_operation_task_equipment': (
+        'simulation_operation_task_id', 'simulation_equipment_id'
+    ),
+    'simulation_order_entity_batch': (
+        'simulation_entity_batch_id', 'order_id'
+    ),
+}
+
+
+def _row_key(table, row):
+    columns = NATURAL_KEYS.get(table)
+    if columns is not None:
+        return tuple(row.get(column) for column in columns)
+    if 'id' in row:
+        return row['id']
+    return json.dumps(row, sort_keys=True, default=str)
+
+
+def merge_collection_payload(merged, payload):
+    # Ответ rest/collection с параметрами with содержит основную таблицу
+    # и связанные с ней таблицы. При постраничном получении одни и те же
+    # связанные строки приходят в нескольких страницах, поэтому строки
+    # складываются в словари по id, а строки таблиц связей -- по
+    # естественному ключу из NATURAL_KEYS.
+    for table, rows in payload.items():
+        if table == 'meta':
+            continue
+        table_rows = merged.setdefault(table, {})
+        for row in rows:
+            table_rows[_row_key(table, row)] = row
+    return merged
+
+
+def collection_payload_to_lists(merged):
+    return {table: list(rows.values()) for table, rows in merged.items()}
+
+
+def project_rows(rows, fields):
+    # Поля, которые не отбросил сервер IA, удаляются на клиенте.
+    if not fields or not rows:
+        return rows
+    fields = tuple(fields)
+    if set(rows[0]).issubset(fields):
+        return rows
+    return [
+        {field: row[field] for field in fields if field in row}
+        for row in rows
+    ]
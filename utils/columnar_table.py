@@ -0,0 +1,111 @@
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+
+__all__ = [
+    'ColumnarTable',
+    'RowView',
+    'DEFAULT_PROJECTIONS',
+]
+
+# Поля, которые используют выгрузки. Остальные колонки самых больших
+# таблиц при хранении в памяти отбрасываются.
+DEFAULT_PROJECTIONS = {
+    'operation': (
+        'id', 'identity', 'name', 'nop', 'entity_route_id',
+        'entity_route_phase_id', 'department_id', 'equipment_class_id',
+        'prod_time', 'prep_time', 'setup_time',
+    ),
+    'entity_batch': (
+        'id', 'identity', 'entity_id', 'operation_id', 'operation_progress',
+        'amount', 'entity_batch_snapshot_id',
+    ),
+}
+
+
+def _build_column(values):
+    # Целые и дробные колонки хранятся в массивах array, пропуски
+    # отмечаются в отдельной маске. Колонки прочих типов остаются
+    # списками, строки в них интернируются.
+    present = [value for value in values if value is not None]
+    nulls = None
+    if len(present) != len(values):
+        nulls = bytearray(value is None for value in values)
+    if all(type(value) is int for value in present):
+        typecode = 'q'
+    elif all(type(value) is float for value in present):
+        typecode = 'd'
+    else:
+        return [
+            sys.intern(value) if type(value) is str else value
+            for value in values
+        ], None
+    try:
+        return array(
+            typecode,
+            (0 if value is None else value for value in values)
+        ), nulls
+    except OverflowError:
+        return list(values), None
+
+
+class RowView(Mapping):
+    # Строка таблицы только для чтения, ведет себя как словарь.
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._table.get_value(key, self._index)
+
+    def __iter__(self):
+        return iter(self._table.fields)
+
+    def __len__(self):
+        return len(self._table.fields)
+
+    def __repr__(self):
+        return f'RowView({dict(self)!r})'
+
+
+class ColumnarTable(Sequence):
+    # Таблица IA, хранящаяся по колонкам. fields -- список сохраняемых
+    # полей, по умолчанию сохраняются все поля первой строки.
+
+    def __init__(self, rows, fields=None):
+        if fields is None:
+            fields = list(rows[0]) if rows else []
+        self.fields = tuple(fields)
+        self._length = len(rows)
+        self._columns = {}
+        self._nulls = {}
+        for field in self.fields:
+            column, nulls = _build_column([row.get(field) for row in rows])
+            self._columns[field] = column
+            if nulls is not None:
+                self._nulls[field] = nulls
+
+    def get_value(self, field, index):
+        column = self._columns[field]
+        nulls = self._nulls.get(field)
+        if nulls is not None and nulls[index]:
+            return None
+        return column[index]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [RowView(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('ColumnarTable index out of range')
+        return RowView(self, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield RowView(self, index)
@@ -0,0 +1,150 @@
+import codecs
+import re
+from json import JSONDecodeError, JSONDecoder
+
+__all__ = [
+    'JSONCollectionStream',
+]
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+_DECODER = JSONDecoder()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _JSONReader(object):
+    # Читает значения JSON из последовательности байтовых кусков, храня
+    # в памяти только еще не разобранный остаток текста.
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read(self):
+        if self._eof:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            chunk = self._decoder.decode(b'', final=True)
+            self._eof = True
+        else:
+            chunk = self._decoder.decode(chunk)
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return not self._eof or bool(chunk)
+
+    def peek(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                raise JSONDecodeError(
+                    'Unexpected end of data', self._buffer, self._pos
+                )
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise JSONDecodeError(
+                f'Expecting {char!r}', self._buffer, self._pos
+            )
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except JSONDecodeError:
+                if not self._read():
+                    raise
+                continue
+            # raw_decode принимает и обрезанное число ('12.' читается
+            # как 12, '1e' как 1), поэтому, пока остаток буфера за числом
+            # может оказаться его продолжением, дочитываем следующий кусок
+            if (
+                    _is_number(value)
+                    and _NUMBER_TAIL.match(self._buffer, end).end()
+                    == len(self._buffer)
+                    and self._read()
+            ):
+                continue
+            self._pos = end
+            return value
+
+    def array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self._pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise JSONDecodeError(
+                    "Expecting ',' delimiter", self._buffer, self._pos - 1
+                )
+
+    def members(self):
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self._pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise JSONDecodeError(
+                    "Expecting ',' delimiter", self._buffer, self._pos - 1
+                )
+
+
+class JSONCollectionStream(object):
+    # Ответ rest/collection, разбираемый по мере получения. При обходе
+    # по одной отдаются строки таблицы table, остальные ключи ответа
+    # (meta, связанные таблицы) после обхода доступны в data. Массивы
+    # разбираются поэлементно, поэтому текст ответа целиком в памяти
+    # не хранится.
+
+    def __init__(self, chunks, table):
+        self.table = table
+        self.data = {}
+        self.found = False
+        self._reader = _JSONReader(chunks)
+
+    @property
+    def meta(self):
+        return self.data.get('meta', {})
+
+    def __iter__(self):
+        reader = self._reader
+        for key in reader.members():
+            if reader.peek() != '[':
+                self.data[key] = reader.value()
+            elif key == self.table:
+                self.found = True
+                yield from reader.array()
+            else:
+                self.data[key] = list(reader.array())
+
+    def to_dict(self):
+        rows = list(self)
+        payload = dict(self.data)
+        if self.found:
+            payload[self.table] = rows
+        return payload
@@ -0,0 +1,92 @@
+from threading import Lock
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+__all__ = [
+    'connection_pool_size',
+    'mount_retry_adapter',
+    'request_timeout',
+    'RequestStats',
+]
+
+DEFAULT_TIMEOUT = (30, 600)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1
+RETRY_STATUSES = (500, 502, 503, 504)
+DEFAULT_POOL_SIZE = 10
+
+
+def connection_pool_size(config, *workers):
+    # Пул соединений не меньше числа одновременных запросов, иначе
+    # urllib3 закрывает лишние соединения ("Connection pool is full")
+    # и keep-alive теряется; pool_size из конфигурации может его только
+    # увеличить.
+    return max(config.get('pool_size') or DEFAULT_POOL_SIZE, *workers)
+
+
+def mount_retry_adapter(session, config, pool_size):
+    # Повторы по ответам 5xx и обрывам чтения выполняются только для GET,
+    # неудачное соединение повторяется для запросов любого типа, так как
+    # до сервера они не дошли. Паузы между повторами растут
+    # экспоненциально: backoff, 2 * backoff, 4 * backoff...
+    retries = config.get('retries')
+    if retries is None:
+        retries = DEFAULT_RETRIES
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=config.get('backoff') or DEFAULT_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        max_retries=retry,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+def request_timeout(config):
+    # timeout задается числом (общий) или парой [соединение, чтение]
+    timeout = config.get('timeout')
+    if timeout is None:
+        return DEFAULT_TIMEOUT
+    if isinstance(timeout, (list, tuple)):
+        return tuple(timeout)
+    return timeout
+
+
+class RequestStats(object):
+    # Время выполнения запросов к IA, сгруппированное по пути ссылки
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stats = {}
+
+    def add(self, url, elapsed):
+        path = urlsplit(url).path
+        with self._lock:
+            count, total, longest = self._stats.get(path, (0, 0.0, 0.0))
+            self._stats[path] = (
+                count + 1, total + elapsed, max(longest, elapsed)
+            )
+
+    def report(self, limit=10):
+        with self._lock:
+            stats = sorted(
+                self._stats.items(),
+                key=lambda item: item[1][1],
+                reverse=True
+            )
+        return [
+            f'{path}: {count} запросов, всего {total:.1f} с, '
+            f'максимум {longest:.1f} с'
+            for path, (count, total, longest) in stats[:limit]
+        ]
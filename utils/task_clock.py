@@ -0,0 +1,133 @@
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, timezone
+
+__all__ = [
+    'TaskClock',
+]
+
+_FALLBACK_FORMATS = (
+    '%Y-%m-%dT%H:%M:%S.%f%z',
+    '%Y-%m-%dT%H:%M:%S%z',
+)
+
+# Смены по умолчанию: задания, начинающиеся до полудня, относятся
+# к смене 07:00, остальные -- к смене 19:00.
+DEFAULT_SHIFTS = (
+    ('00:00', '07:00:00'),
+    ('12:00', '19:00:00'),
+)
+
+# Без настройки timezone из времени IA вычитаются 3 часа, а смещение
+# часового пояса отбрасывается, как это делалось раньше.
+_LEGACY_OFFSET = timedelta(hours=3)
+
+
+def _make_shifts(shifts):
+    # смены из настройки shifts: пары (начало ЧЧ:ММ, метка), которые
+    # сортируются по началу для bisect_right. Целое начало -- минуты от
+    # полуночи: так YAML читает записанное без кавычек 12:00.
+    parsed = {}
+    for shift in shifts:
+        try:
+            start, label = shift
+            if isinstance(start, int):
+                hours, minutes = divmod(start, 60)
+            else:
+                hours, minutes = str(start).split(':')[:2]
+                hours, minutes = int(hours), int(minutes)
+        except (TypeError, ValueError):
+            raise ValueError(
+                f'Смена {shift!r} должна задаваться парой '
+                f'[начало ЧЧ:ММ, метка]'
+            ) from None
+        if not (0 <= hours < 24 and 0 <= minutes < 60):
+            raise ValueError(f'Неверное начало смены {start!r}')
+        start_minutes = hours * 60 + minutes
+        if start_minutes in parsed:
+            raise ValueError(f'Две смены начинаются в {start}')
+        parsed[start_minutes] = label
+    if not parsed:
+        raise ValueError('Не задано ни одной смены')
+    return sorted(parsed.items())
+
+
+def _make_timezone(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return timezone(timedelta(hours=value))
+    from zoneinfo import ZoneInfo
+    return ZoneInfo(value)
+
+
+class TaskClock(object):
+    # Разбор времени заданий IA и распределение их по дням и сменам.
+    # День -- порядковый номер даты (date.toordinal), смена -- номер
+    # в списке смен. Результаты разбора запоминаются по исходной строке.
+
+    def __init__(self, tz=None, shifts=None):
+        self.tz = tz
+        shifts = _make_shifts(shifts or DEFAULT_SHIFTS)
+        self._starts = [start for start, _ in shifts]
+        self._labels = [label for _, label in shifts]
+        self._buckets = {}
+        self._day_labels = {}
+
+    def parse(self, value):
+        try:
+            task_time = datetime.fromisoformat(value)
+        except ValueError:
+            for time_format in _FALLBACK_FORMATS:
+                try:
+                    task_time = datetime.strptime(value, time_format)
+                    break
+                except ValueError:
+                    continue
+            else:
+                raise
+        if self.tz is None:
+            return (task_time - _LEGACY_OFFSET).replace(tzinfo=None)
+        if task_time.tzinfo is None:
+            return task_time
+        return task_time.astimezone(self.tz).replace(tzinfo=None)
+
+    def day_shift(self, value):
+        bucket = self._buckets.get(value)
+        if bucket is None:
+            task_time = self.parse(value)
+            day = task_time.toordinal()
+            shift = bisect_right(
+                self._starts, task_time.hour * 60 + task_time.minute
+            ) - 1
+            if shift < 0:
+                # задание до начала первой смены относится к последней
+                # смене предыдущего дня
+                day -= 1
+                shift = len(self._starts) - 1
+            bucket = self._buckets[value] = (day, shift)
+        return bucket
+
+    def day(self, value):
+        return self.day_shift(value)[0]
+
+    def today(self):
+        # сегодняшний день по времени завода, если задан timezone
+        if self.tz is None:
+            return date.today().toordinal()
+        return datetime.now(self.tz).date().toordinal()
+
+    def day_label(self, day):
+        label = self._day_labels.get(day)
+        if label is None:
+            label = self._day_labels[day] = date.fromordinal(day).isoformat()
+        return label
+
+    def shift_label(self, shift):
+        return self._labels[shift]
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            _make_timezone(config.get('timezone')),
+            config.get('shifts')
+        )
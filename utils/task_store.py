@@ -0,0 +1,147 @@
+import ast
+import csv
+import json
+import os
+from logging import getLogger
+from pathlib import Path
+from tempfile import mkstemp
+from threading import Lock, RLock
+
+__all__ = [
+    'TaskStore',
+]
+
+_SUFFIX = '.json'
+
+# Хранилище по одному пути общее для выгрузок, которые могут выполняться
+# параллельно (export_ca_daily_tasks и export_ca_daily_tasks_from_raport),
+# поэтому чтение, prune, disappeared и save выполняются под блокировкой
+# этого пути.
+_PATH_LOCKS = {}
+_PATH_LOCKS_GUARD = Lock()
+
+
+def _path_lock(path):
+    with _PATH_LOCKS_GUARD:
+        return _PATH_LOCKS.setdefault(os.path.abspath(path), RLock())
+
+
+class TaskStore(object):
+    # Записи сменного задания из прошлых выгрузок. Каждая дата начала
+    # (dateBegin) хранится в отдельном файле-разделе со словарем
+    # identity -> запись. Прошедшие даты удаляются целыми файлами,
+    # а перезаписываются только изменившиеся разделы. Работа с хранилищем
+    # ведется внутри with, который блокирует путь хранилища.
+
+    def __init__(self, path, legacy_csv=None, logger=None):
+        self.path = Path(path)
+        self.legacy_csv = legacy_csv and Path(legacy_csv)
+        self._logger = logger or getLogger(__name__)
+        self._partitions = None
+        self._dirty = set()
+        self._lock = _path_lock(self.path)
+
+    def __enter__(self):
+        self._lock.acquire()
+        # разделы перечитываются: их мог изменить другой владелец пути
+        self._partitions = None
+        self._dirty = set()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._lock.release()
+
+    def _partition_path(self, date_begin):
+        return self.path / f'{date_begin}{_SUFFIX}'
+
+    def _load(self):
+        if self._partitions is not None:
+            return self._partitions
+        self._partitions = {}
+        if self.path.is_dir():
+            for partition_path in self.path.glob(f'*{_SUFFIX}'):
+                with open(partition_path, 'r', encoding='utf-8') as input_file:
+                    self._partitions[partition_path.stem] = json.load(
+                        input_file
+                    )
+        if not self._partitions and self.legacy_csv and \
+                self.legacy_csv.exists():
+            self._import_legacy_csv()
+        return self._partitions
+
+    def _import_legacy_csv(self):
+        # Однократный перенос записей из tasks.csv.bak прежних версий.
+        # Оборудование там сохранено как repr списка словарей.
+        with open(self.legacy_csv, 'r', newline='') as input_file:
+            for row in csv.DictReader(input_file):
+                if row.get('equipments'):
+                    try:
+                        row['equipments'] = ast.literal_eval(
+                            row['equipments']
+                        )
+                    except (ValueError, SyntaxError):
+                        pass
+                else:
+                    row['equipments'] = None
+                self._partitions.setdefault(
+                    row['dateBegin'], {}
+                )[row['identity']] = row
+        self._logger.info('Записи из {} перенесены в {}'.format(
+            self.legacy_csv, self.path
+        ))
+        self._dirty = set(self._partitions)
+
+    def prune(self, today):
+        # today -- дата в формате dateBegin, более ранние разделы удаляются
+        partitions = self._load()
+        for date_begin in [key for key in partitions if key < today]:
+            del partitions[date_begin]
+            self._partition_path(date_begin).unlink(missing_ok=True)
+
+    def disappeared(self, rows):
+        # записи прошлых выгрузок, которых нет среди rows (identity -> запись)
+        return [
+            row
+            for partition in self._load().values()
+            for identity, row in partition.items()
+            if identity not in rows
+        ]
+
+    def save(self, rows):
+        # rows становятся полным содержимым хранилища
+        partitions = {}
+        for row in rows:
+            partitions.setdefault(str(row['dateBegin']), {})[
+                row['identity']
+            ] = row
+        stored = self._load()
+        self.path.mkdir(parents=True, exist_ok=True)
+        for date_begin, partition in partitions.items():
+            if stored.get(date_begin) == partition and \
+                    date_begin not in self._dirty:
+                continue
+            temp_fd, temp_path = mkstemp(
+                prefix=f'{date_begin}.', suffix='.tmp', dir=self.path
+            )
+            try:
+                with os.fdopen(temp_fd, 'w', encoding='utf-8') as output_file:
+                    json.dump(partition, output_file, ensure_ascii=False)
+                os.replace(temp_path, self._partition_path(date_begin))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        for date_begin in set(stored) - set(partitions):
+            self._partition_path(date_begin).unlink(missing_ok=True)
+        self._partitions = partitions
+        self._dirty = set()
+        if self.legacy_csv and self.legacy_csv.exists():
+            self.legacy_csv.replace(
+                self.legacy_csv.with_name(self.legacy_csv.name + '.imported')
+            )
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config.get('task_store') or 'tasks.bak',
+            config.get('legacy_task_csv') or 'tasks.csv.bak'
+        )